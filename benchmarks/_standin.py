@@ -0,0 +1,441 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2024 azicen <chenjiazi2000@outlook.com>
+#
+# This file is part of PeerBanHelperAdapter and is licensed under MIT license, or later,
+# with the additional special exception to link portions of this program with
+# the OpenSSL library. See LICENSE for more details.
+"""基准测试使用的 Deluge / libtorrent 替身
+
+install 只在当前环境未安装 Deluge 时注入 deluge.common 等纯函数模块，已安装时使用真实模块。
+install_daemon 额外注入守护进程相关的组件（会话、TorrentManager、配置等），
+使 Core 可以在没有 Deluge 守护进程的环境中启用；未安装 Twisted 时同时注入最小的 reactor 替身。
+"""
+import os
+import sys
+import time
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _decode_bytes(byte_str, encoding="utf8"):
+    if isinstance(byte_str, str):
+        return byte_str
+    return byte_str.decode(encoding)
+
+
+def install():
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    try:
+        import deluge.common  # noqa: F401
+        return
+    except ImportError:
+        pass
+
+    _module("deluge")
+    _module("deluge.common", decode_bytes=_decode_bytes)
+    _module("deluge.plugins")
+    _module("deluge.plugins.init", PluginInitBase=object)
+
+
+def install_daemon(config_dir):
+    """注入守护进程替身，配置与数据文件写入 config_dir
+
+    Returns:
+        组件注册表（名称 -> 对象），由调用方注册 Core、TorrentManager 等组件
+    """
+    install()
+    registry = {}
+
+    def get_config_dir(filename=None):
+        return os.path.join(config_dir, filename) if filename else config_dir
+
+    _module("deluge.component", get=registry.__getitem__)
+    _module("deluge.configmanager", ConfigManager=FakeConfigManager, get_config_dir=get_config_dir)
+    _module("deluge.core")
+    _module("deluge.core.rpcserver", export=lambda func: func)
+    _module("deluge.core.torrentmanager", TorrentManager=FakeTorrentManager)
+    _module("deluge.plugins.pluginbase", CorePluginBase=FakeCorePluginBase)
+    _module("deluge._libtorrent", lt=_fake_libtorrent())
+    try:
+        import twisted.internet.task  # noqa: F401
+    except ImportError:
+        _install_twisted()
+    return registry
+
+
+def _module(name, **attrs):
+    module = types.ModuleType(name)
+    module.__path__ = []
+    module.__dict__.update(attrs)
+    sys.modules[name] = module
+    parent, _, child = name.rpartition(".")
+    if parent:
+        setattr(sys.modules[parent], child, module)
+    return module
+
+
+class FakeSha1Hash:
+    """libtorrent sha1_hash 替身"""
+
+    __slots__ = ("raw",)
+
+    def __init__(self, raw):
+        self.raw = raw
+
+    def to_bytes(self):
+        return self.raw
+
+    def __str__(self):
+        return self.raw.hex()
+
+
+class FakePeerInfo:
+    """libtorrent peer_info 替身，字段取值固定"""
+
+    connecting = 0x1
+    handshake = 0x2
+
+    def __init__(self, index):
+        self.ip = ("10.%d.%d.%d" % (index >> 16 & 0xFF, index >> 8 & 0xFF, index & 0xFF), 6881)
+        self.pid = FakeSha1Hash(b"-qB4500-" + index.to_bytes(12, "big"))
+        self.client = b"qBittorrent 4.5.0"
+        self.local_endpoint = ("192.168.1.2", 51413)
+        self.up_speed = index % 1000
+        self.down_speed = index % 700
+        self.payload_up_speed = index % 900
+        self.payload_down_speed = index % 600
+        self.total_upload = index * 1024
+        self.total_download = index * 512
+        self.progress = (index % 100) / 100
+        self.flags = 0x4
+        self.source = 0x1
+        self.queue_bytes = 0
+        self.request_timeout = 0
+        self.num_hashfails = 0
+        self.download_queue_length = 0
+        self.upload_queue_length = 0
+        self.failcount = 0
+        self.downloading_block_index = -1
+        self.downloading_progress = 0
+        self.downloading_total = 0
+        self.connection_type = 0
+        self.send_quota = 0
+        self.receive_quota = 0
+        self.rtt = 20
+        self.num_pieces = index % 2000
+        self.download_rate_peak = 0
+        self.upload_rate_peak = 0
+        self.progress_ppm = (index % 100) * 10000
+
+
+class FakeConfigManager(dict):
+    """deluge.configmanager.ConfigManager 替身，只保存在内存中"""
+
+    def __init__(self, filename, defaults=None):
+        super().__init__(defaults or {})
+        self.filename = filename
+
+    def save(self):
+        pass
+
+
+class FakeCorePluginBase:
+    def __init__(self, plugin_name):
+        self.plugin_name = plugin_name
+
+
+class FakeIpFilter:
+    def __init__(self):
+        self.rules = []
+
+    def add_rule(self, first, last, flags):
+        self.rules.append((first, last, flags))
+
+    def export_filter(self):
+        # 替身不合并范围，只用于启用时读取已有规则
+        return (
+            [(first, last) for first, last, _ in self.rules if ":" not in first],
+            [(first, last) for first, last, _ in self.rules if ":" in first],
+        )
+
+    def access(self, ip):
+        for first, last, flags in reversed(self.rules):
+            if first == ip:
+                return flags
+        return 0
+
+
+class FakeStatsMetric:
+    def __init__(self, name, value_index):
+        self.name = name
+        self.value_index = value_index
+
+
+# 替身会话提供的会话统计
+FAKE_METRIC_NAMES = (
+    "net.sent_payload_bytes",
+    "net.sent_bytes",
+    "net.sent_ip_overhead_bytes",
+    "net.sent_tracker_bytes",
+    "net.recv_payload_bytes",
+    "net.recv_bytes",
+    "net.recv_ip_overhead_bytes",
+    "net.recv_tracker_bytes",
+    "net.limiter_up_bytes",
+    "net.limiter_down_bytes",
+    "net.recv_redundant_bytes",
+    "net.recv_failed_bytes",
+    "dht.dht_bytes_in",
+    "dht.dht_bytes_out",
+    "dht.dht_nodes",
+    "peer.num_peers_up_disk",
+    "peer.num_peers_down_disk",
+    "peer.num_peers_connected",
+    "disk.queued_disk_jobs",
+)
+
+
+def _fake_libtorrent():
+    category_t = types.SimpleNamespace(connect_notification=0x4, peer_notification=0x2)
+    return types.SimpleNamespace(
+        ip_filter=FakeIpFilter,
+        alert=types.SimpleNamespace(category_t=category_t),
+        session_stats_metrics=lambda: [FakeStatsMetric(name, i) for i, name in enumerate(FAKE_METRIC_NAMES)],
+    )
+
+
+class _DelayedCall:
+    def __init__(self, delay, func, args, kwargs):
+        self.time = time.time() + delay
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.cancelled = False
+
+    def active(self):
+        return not self.cancelled
+
+    def cancel(self):
+        self.cancelled = True
+
+    def getTime(self):
+        return self.time
+
+
+class _Reactor:
+    """只记录延迟调用的 reactor 替身，基准测试中不会执行到期的调用"""
+
+    def callLater(self, delay, func, *args, **kwargs):
+        return _DelayedCall(delay, func, args, kwargs)
+
+
+class _LoopingCall:
+    def __init__(self, func, *args, **kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.running = False
+        self.interval = None
+
+    def start(self, interval, now=True):
+        self.running = True
+        self.interval = interval
+        if now:
+            self.func(*self.args, **self.kwargs)
+
+    def stop(self):
+        self.running = False
+
+
+def _defer_to_thread(func, *args, **kwargs):
+    raise NotImplementedError("基准测试不启用后台快照采集")
+
+
+def _install_twisted():
+    _module("twisted")
+    _module("twisted.internet", reactor=_Reactor())
+    _module("twisted.internet.task", LoopingCall=_LoopingCall)
+    _module("twisted.internet.threads", deferToThread=_defer_to_thread)
+
+
+class FakeTorrentInfo:
+    def __init__(self, size, piece_length):
+        self._size = size
+        self._piece_length = piece_length
+
+    def total_size(self):
+        return self._size
+
+    def priv(self):
+        return False
+
+    def piece_length(self):
+        return self._piece_length
+
+
+class FakeHandle:
+    def __init__(self, peers, torrent_info):
+        self.peers = peers
+        self.info = torrent_info
+
+    def is_valid(self):
+        return True
+
+    def get_peer_info(self):
+        return self.peers
+
+    def torrent_file(self):
+        return self.info
+
+    def status(self, flags=0xFFFFFFFF):
+        return self.torrent_status
+
+
+class FakeTorrentStatus:
+    """libtorrent torrent_status 替身"""
+
+    def __init__(self, info_hash, handle, index):
+        self.info_hash = info_hash
+        self.handle = handle
+        self.has_metadata = True
+        self.num_pieces = index % 500
+        self.upload_payload_rate = 1024 + index
+        self.download_payload_rate = index % 3
+        self.progress = (index % 100) / 100
+
+
+class FakeTorrent:
+    """deluge.core.torrent.Torrent 替身"""
+
+    def __init__(self, torrent_id, status):
+        self.torrent_id = torrent_id
+        self.status = status
+        self.handle = status.handle
+
+    def get_name(self):
+        return "torrent-%s" % self.torrent_id[:8]
+
+    def get_progress(self):
+        return self.status.progress * 100
+
+
+class FakeTorrentManager:
+    def __init__(self, torrents):
+        # torrent_id -> FakeTorrent
+        self.torrents = torrents
+
+
+class FakeFilterManager:
+    def __init__(self, torrentmanager):
+        self.torrentmanager = torrentmanager
+
+    def filter_torrent_ids(self, filter_dict):
+        return list(self.torrentmanager.torrents)
+
+
+class FakeAlertManager:
+    def __init__(self):
+        self.handlers = {}
+
+    def register_handler(self, alert_type, handler):
+        self.handlers.setdefault(alert_type, []).append(handler)
+
+    def deregister_handler(self, handler):
+        for handlers in self.handlers.values():
+            if handler in handlers:
+                handlers.remove(handler)
+
+    def post(self, alert_type, alert):
+        for handler in list(self.handlers.get(alert_type, ())):
+            handler(alert)
+
+
+class FakeEventManager:
+    def __init__(self):
+        self.handlers = {}
+
+    def register_event_handler(self, event, handler):
+        self.handlers.setdefault(event, []).append(handler)
+
+    def deregister_event_handler(self, event, handler):
+        if handler in self.handlers.get(event, ()):
+            self.handlers[event].remove(handler)
+
+    def emit(self, event, *args):
+        for handler in list(self.handlers.get(event, ())):
+            handler(*args)
+
+
+class FakeSessionStatsAlert:
+    def __init__(self, counters):
+        self._counters = counters
+
+    def counters(self):
+        return self._counters
+
+
+class FakeSession:
+    """libtorrent session 替身"""
+
+    def __init__(self, torrentmanager, alertmanager):
+        self.torrentmanager = torrentmanager
+        self.alertmanager = alertmanager
+        self.ip_filter = FakeIpFilter()
+        self.settings = {"alert_mask": 0x1}
+        self._stats_calls = 0
+
+    def get_torrent_status(self, predicate, flags):
+        statuses = (torrent.status for torrent in self.torrentmanager.torrents.values())
+        return [status for status in statuses if predicate(status)]
+
+    def get_ip_filter(self):
+        return self.ip_filter
+
+    def set_ip_filter(self, ip_filter):
+        self.ip_filter = ip_filter
+
+    def get_settings(self):
+        return dict(self.settings)
+
+    def apply_settings(self, settings):
+        self.settings.update(settings)
+
+    def post_session_stats(self):
+        # 计数器随调用次数增长，使速率不为 0
+        self._stats_calls += 1
+        counters = [self._stats_calls * 1024 * (index + 1) for index in range(len(FAKE_METRIC_NAMES))]
+        self.alertmanager.post("session_stats_alert", FakeSessionStatsAlert(counters))
+
+
+class FakeCore:
+    def __init__(self, session):
+        self.session = session
+
+
+def build_daemon(registry, torrents, peers_per_torrent):
+    """生成指定规模的种子与节点，并注册到组件注册表"""
+    torrent_map = {}
+    peer_index = 0
+    for index in range(torrents):
+        torrent_id = "%040x" % index
+        lt_peers = [FakePeerInfo(peer_index + offset) for offset in range(peers_per_torrent)]
+        peer_index += peers_per_torrent
+        handle = FakeHandle(lt_peers, FakeTorrentInfo(1 << 30, 1 << 20))
+        status = FakeTorrentStatus(torrent_id, handle, index)
+        handle.torrent_status = status
+        torrent_map[torrent_id] = FakeTorrent(torrent_id, status)
+
+    torrentmanager = FakeTorrentManager(torrent_map)
+    alertmanager = FakeAlertManager()
+    session = FakeSession(torrentmanager, alertmanager)
+    registry.clear()
+    registry.update(
+        Core=FakeCore(session),
+        TorrentManager=torrentmanager,
+        FilterManager=FakeFilterManager(torrentmanager),
+        AlertManager=alertmanager,
+        EventManager=FakeEventManager(),
+    )
+    return session
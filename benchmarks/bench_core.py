@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2024 azicen <chenjiazi2000@outlook.com>
+#
+# This file is part of PeerBanHelperAdapter and is licensed under MIT license, or later,
+# with the additional special exception to link portions of this program with
+# the OpenSSL library. See LICENSE for more details.
+"""Core RPC 基准
+
+在替身会话、TorrentManager 与种子句柄上启用 Core，按种子数、每种子节点数与封禁列表大小的组合，
+测量各 RPC 的耗时、Python 内存分配峰值与 JSON 响应大小。结果以 JSON 输出，便于在版本间比较。
+
+    python benchmarks/bench_core.py --torrents 100,1000 --peers 50 --blocklist 10000 --output result.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import _standin
+
+CONFIG_DIR = tempfile.mkdtemp(prefix="pbh-bench-")
+REGISTRY = _standin.install_daemon(CONFIG_DIR)
+
+from deluge_peerbanhelperadapter.core import Core  # noqa: E402
+
+# 每次 ban_ips 调用封禁的条目数
+BAN_BATCH = 100
+# replace_blocklist 每次调用变更的条目数
+REPLACE_DELTA = 100
+# get_torrents_peers 查询的种子数
+SELECTED_TORRENTS = 10
+
+
+def _blocklist_entries(count, offset=0):
+    return ["172.%d.%d.%d" % (i >> 16 & 0xFF, i >> 8 & 0xFF, i & 0xFF) for i in range(offset, offset + count)]
+
+
+def _cases(core, blocklist_size):
+    """返回 [(名称, 每次调用前的准备函数, 调用函数)]"""
+    ban_offset = [blocklist_size]
+
+    def next_ban_batch():
+        entries = _blocklist_entries(BAN_BATCH, ban_offset[0])
+        ban_offset[0] += BAN_BATCH
+        return entries
+
+    # 交替提交两份相差 REPLACE_DELTA 个条目的列表，每次替换都有实际变更
+    blocklists = [
+        _blocklist_entries(blocklist_size),
+        _blocklist_entries(blocklist_size - REPLACE_DELTA) + _blocklist_entries(REPLACE_DELTA, 1 << 23),
+    ]
+    replace_round = [0]
+
+    def next_blocklist():
+        replace_round[0] += 1
+        return blocklists[replace_round[0] % 2]
+
+    def flushed(result):
+        # 过滤器由 reactor.callLater 延迟应用，替身 reactor 不会执行，在计时范围内立即应用
+        core.ip_filter.flush()
+        return result
+
+    selected = list(core.torrentmanager.torrents)[:SELECTED_TORRENTS]
+    return [
+        ("get_active_torrents_info", None, lambda _: core.get_active_torrents_info()),
+        ("get_active_torrents_info[rows]", None, lambda _: core.get_active_torrents_info(peer_format="rows")),
+        ("get_torrents_info", None, lambda _: core.get_torrents_info()),
+        ("get_torrents_peers[%d]" % SELECTED_TORRENTS, None, lambda _: core.get_torrents_peers(selected)),
+        ("ban_ips", next_ban_batch, lambda entries: flushed(core.ban_ips(entries))),
+        ("replace_blocklist", next_blocklist, lambda entries: flushed(core.replace_blocklist(entries))),
+        ("get_session_totals", core.session.post_session_stats, lambda _: core.get_session_totals()),
+    ]
+
+
+def _measure(prepare, call, repeat):
+    latencies = []
+    result = None
+    for _ in range(repeat):
+        argument = prepare() if prepare is not None else None
+        start = time.perf_counter()
+        result = call(argument)
+        latencies.append(time.perf_counter() - start)
+
+    # 内存分配峰值单独测量，避免 tracemalloc 影响耗时
+    argument = prepare() if prepare is not None else None
+    tracemalloc.start()
+    call(argument)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "latency_ms": {
+            "min": latencies[0] * 1e3,
+            "median": statistics.median(latencies) * 1e3,
+            "p95": latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)] * 1e3,
+            "max": latencies[-1] * 1e3,
+        },
+        "peak_alloc_bytes": peak,
+        "response_bytes": len(json.dumps(result).encode("utf-8")),
+    }
+
+
+def run_scenario(torrents, peers, blocklist_size, repeat):
+    for name in os.listdir(CONFIG_DIR):
+        os.remove(os.path.join(CONFIG_DIR, name))
+    _standin.build_daemon(REGISTRY, torrents, peers)
+
+    core = Core("PeerBanHelperAdapter")
+    core.enable()
+    core.replace_blocklist(_blocklist_entries(blocklist_size))
+    results = []
+    try:
+        for name, prepare, call in _cases(core, blocklist_size):
+            result = _measure(prepare, call, repeat)
+            result.update(rpc=name, torrents=torrents, peers_per_torrent=peers, blocklist_size=blocklist_size)
+            results.append(result)
+    finally:
+        core.disable()
+    return results
+
+
+def _sizes(value):
+    return [int(item) for item in value.split(",") if item]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--torrents", type=_sizes, default=[100, 1000], help="种子数，逗号分隔")
+    parser.add_argument("--peers", type=_sizes, default=[50], help="每个种子的节点数，逗号分隔")
+    parser.add_argument("--blocklist", type=_sizes, default=[10000], help="封禁列表大小，逗号分隔")
+    parser.add_argument("--repeat", type=int, default=5, help="每个 RPC 的重复次数")
+    parser.add_argument("--output", help="JSON 结果文件，默认输出到标准输出")
+    args = parser.parse_args(argv)
+
+    results = []
+    try:
+        for torrents in args.torrents:
+            for peers in args.peers:
+                for blocklist_size in args.blocklist:
+                    for result in run_scenario(torrents, peers, blocklist_size, args.repeat):
+                        results.append(result)
+                        print("%-32s %6d x %-5d bl=%-7d median %9.2f ms  peak %8.1f KiB  resp %9d B" % (
+                            result["rpc"], torrents, peers, blocklist_size, result["latency_ms"]["median"],
+                            result["peak_alloc_bytes"] / 1024, result["response_bytes"],
+                        ), file=sys.stderr)
+    finally:
+        shutil.rmtree(CONFIG_DIR, ignore_errors=True)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        # 进程的最大常驻内存（KiB），包含生成替身数据的开销
+        "max_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
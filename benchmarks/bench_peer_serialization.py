@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2024 azicen <chenjiazi2000@outlook.com>
+#
+# This file is part of PeerBanHelperAdapter and is licensed under MIT license, or later,
+# with the additional special exception to link portions of this program with
+# the OpenSSL library. See LICENSE for more details.
+"""节点序列化微基准
+
+对比旧实现（构造 Peer 数据类并经 dataclasses.asdict 递归深拷贝）
+与当前实现（直接构造元组并按格式编码）的单节点耗时。
+每种实现重复采集同一批节点，节点 ID 与客户端名称的解码缓存在首轮之后命中。
+
+    python benchmarks/bench_peer_serialization.py [节点数 ...]
+"""
+import sys
+import time
+from dataclasses import asdict
+
+import _standin
+
+_standin.install()
+
+from deluge.common import decode_bytes  # noqa: E402
+
+from deluge_peerbanhelperadapter.collector import (  # noqa: E402
+    PEER_FORMAT_COLUMNS,
+    PEER_FORMAT_DICT,
+    PEER_FORMAT_ROWS,
+    decode_cache_info,
+    encode_peers,
+    peer_row_builder,
+)
+from deluge_peerbanhelperadapter.model.torrent import PEER_FIELDS, ActiveTorrent, Peer  # noqa: E402
+
+DEFAULT_SIZES = (10000, 50000, 100000)
+REPEAT = 3
+
+
+def _client_name(lt_peer):
+    try:
+        return decode_bytes(lt_peer.client)
+    except UnicodeDecodeError:
+        return "unknown"
+
+
+def before(lt_peers):
+    peers = []
+    for lt_peer in lt_peers:
+        peers.append(Peer(
+            ip=lt_peer.ip[0],
+            port=lt_peer.ip[1],
+            peer_id=str(lt_peer.pid),
+            client_name=_client_name(lt_peer),
+            up_speed=lt_peer.up_speed,
+            down_speed=lt_peer.down_speed,
+            payload_up_speed=lt_peer.payload_up_speed,
+            payload_down_speed=lt_peer.payload_down_speed,
+            total_upload=lt_peer.total_upload,
+            total_download=lt_peer.total_download,
+            progress=lt_peer.progress,
+            flags=lt_peer.flags,
+            source=lt_peer.source,
+            local_endpoint_ip=lt_peer.local_endpoint[0],
+            local_endpoint_port=lt_peer.local_endpoint[1],
+            queue_bytes=lt_peer.queue_bytes,
+            request_timeout=lt_peer.request_timeout,
+            num_hashfails=lt_peer.num_hashfails,
+            download_queue_length=lt_peer.download_queue_length,
+            upload_queue_length=lt_peer.upload_queue_length,
+            failcount=lt_peer.failcount,
+            downloading_block_index=lt_peer.downloading_block_index,
+            downloading_progress=lt_peer.downloading_progress,
+            downloading_total=lt_peer.downloading_total,
+            connection_type=lt_peer.connection_type,
+            send_quota=lt_peer.send_quota,
+            receive_quota=lt_peer.receive_quota,
+            rtt=lt_peer.rtt,
+            num_pieces=lt_peer.num_pieces,
+            download_rate_peak=lt_peer.download_rate_peak,
+            upload_rate_peak=lt_peer.upload_rate_peak,
+            progress_ppm=lt_peer.progress_ppm,
+        ))
+    return asdict(ActiveTorrent(peers=peers))
+
+
+def after(peer_format):
+    build_row = peer_row_builder(PEER_FIELDS)
+
+    def run(lt_peers):
+        rows = [build_row(lt_peer) for lt_peer in lt_peers]
+        return encode_peers(rows, PEER_FIELDS, peer_format)
+
+    return run
+
+
+def measure(func, lt_peers):
+    best = None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        func(lt_peers)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(sizes):
+    cases = [
+        ("before: Peer + asdict", before),
+        ("after: dict", after(PEER_FORMAT_DICT)),
+        ("after: rows", after(PEER_FORMAT_ROWS)),
+        ("after: columns", after(PEER_FORMAT_COLUMNS)),
+    ]
+    print("%-24s %10s %12s %12s" % ("case", "peers", "total (ms)", "per peer (us)"))
+    for size in sizes:
+        lt_peers = [_standin.FakePeerInfo(index) for index in range(size)]
+        for name, func in cases:
+            elapsed = measure(func, lt_peers)
+            print("%-24s %10d %12.1f %12.2f" % (name, size, elapsed * 1e3, elapsed / size * 1e6))
+
+    for name, info in decode_cache_info().items():
+        print("%s cache: hit rate %.1f%%, %d/%d entries" % (
+            name, info["hit_rate"] * 100, info["size"], info["maxsize"]
+        ))
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2024 azicen <chenjiazi2000@outlook.com>
+#
+# This file is part of PeerBanHelperAdapter and is licensed under MIT license, or later,
+# with the additional special exception to link portions of this program with
+# the OpenSSL library. See LICENSE for more details.
+from __future__ import unicode_literals
+
+import threading
+from collections import namedtuple
+
+from deluge_peerbanhelperadapter.collector import TorrentSource
+
+# 种子的元数据，极少变化，由 Deluge 种子事件失效
+TorrentStaticInfo = namedtuple("TorrentStaticInfo", ["name", "size", "priv", "piece_length"])
+
+
+def _is_active(status):
+    # 与 FilterManager 的 Active 过滤条件一致
+    return status.download_payload_rate > 0 or status.upload_payload_rate > 0
+
+
+def _is_any(status):
+    return True
+
+
+class TorrentAcquirer:
+    """批量获取种子状态
+
+    每次查询只调用一次 session.get_torrent_status，由 libtorrent 网络线程一次性返回
+    所有匹配种子的 torrent_status，不再对每个种子分别调用 handle.status()。
+    名称与 torrent_info 中的数据按种子缓存，只在首次遇到该种子时读取一次，
+    之后由 Deluge 的种子事件（参见 handlers）失效，下次查询时重新读取。
+    后台快照采集会在线程池中调用，缓存的修改由锁保护。
+    """
+
+    def __init__(self, session, torrentmanager):
+        self.session = session
+        self.torrentmanager = torrentmanager
+        # torrent_id -> TorrentStaticInfo
+        self.static_info: dict[str, TorrentStaticInfo] = {}
+        self._lock = threading.Lock()
+
+    def handlers(self):
+        """返回 Deluge 事件名称 -> 处理函数，用于 EventManager.register_event_handler"""
+        return {
+            "TorrentAddedEvent": self.invalidate,
+            "TorrentRemovedEvent": self.invalidate,
+            "TorrentFinishedEvent": self.invalidate,
+            "TorrentStateChangedEvent": self.invalidate,
+            "TorrentFolderRenamedEvent": self.invalidate,
+        }
+
+    def invalidate(self, torrent_id, *args):
+        """丢弃种子的缓存，下次查询时重新读取"""
+        with self._lock:
+            self.static_info.pop(torrent_id, None)
+
+    def active_sources(self):
+        """返回所有活跃种子的 TorrentSource 列表"""
+        return self._sources(_is_active)
+
+    def all_sources(self):
+        """返回所有种子的 TorrentSource 列表，同时清理已移除种子的缓存"""
+        sources = self._sources(_is_any)
+        # 事件处理之外的兜底：事件可能在插件启用前发出
+        if len(self.static_info) > len(sources):
+            present = {source.torrent_id for source in sources}
+            with self._lock:
+                for torrent_id in [k for k in self.static_info if k not in present]:
+                    del self.static_info[torrent_id]
+        return sources
+
+    def selected_sources(self, torrent_ids):
+        """返回指定种子的 TorrentSource 列表，忽略不存在的种子
+
+        逐个调用 handle.status()，开销只与所选种子数量相关，不会遍历全部种子。
+
+        Args:
+            torrent_ids (list[str]): 种子 ID（info hash）
+        """
+        torrents = self.torrentmanager.torrents
+        sources = []
+        for torrent_id in dict.fromkeys(str(torrent_id).lower() for torrent_id in torrent_ids):
+            torrent = torrents.get(torrent_id)
+            if torrent is None or not torrent.handle.is_valid():
+                continue
+            status = torrent.handle.status(0)
+            info = self.static_info.get(torrent_id)
+            if info is None:
+                info = self._static_info(torrent_id, torrent, status)
+            sources.append(TorrentSource(torrent_id, torrent, status, info))
+        return sources
+
+    def _sources(self, predicate):
+        torrents = self.torrentmanager.torrents
+        sources = []
+        for status in self.session.get_torrent_status(predicate, 0):
+            torrent_id = str(status.info_hash)
+            torrent = torrents.get(torrent_id)
+            if torrent is None:
+                # libtorrent 中存在但 Deluge 尚未接管（正在添加或移除）
+                continue
+            info = self.static_info.get(torrent_id)
+            if info is None:
+                info = self._static_info(torrent_id, torrent, status)
+            sources.append(TorrentSource(torrent_id, torrent, status, info))
+        return sources
+
+    def _static_info(self, torrent_id, torrent, status):
+        if not status.has_metadata:
+            # 尚未获取到元数据（磁力链接），不缓存，获取元数据后名称也会变化
+            return TorrentStaticInfo(torrent.get_name(), 0, False, 0)
+
+        torrent_info = status.handle.torrent_file()
+        info = TorrentStaticInfo(
+            name=torrent.get_name(),
+            size=torrent_info.total_size(),
+            priv=torrent_info.priv(),
+            piece_length=torrent_info.piece_length(),
+        )
+        with self._lock:
+            self.static_info[torrent_id] = info
+        return info
@@ -0,0 +1,571 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2024 azicen <chenjiazi2000@outlook.com>
+#
+# This file is part of PeerBanHelperAdapter and is licensed under MIT license, or later,
+# with the additional special exception to link portions of this program with
+# the OpenSSL library. See LICENSE for more details.
+from __future__ import unicode_literals
+
+import hashlib
+import ipaddress
+import logging
+import heapq
+import math
+import socket
+from bisect import bisect_left, bisect_right
+from collections import deque
+
+from deluge_peerbanhelperadapter.cursor import entries_since, format_cursor, new_epoch, parse_cursor
+
+log = logging.getLogger(__name__)
+
+_ADDRESS_FAMILIES = {4: socket.AF_INET, 6: socket.AF_INET6}
+_ADDRESS_BYTES = {4: 4, 6: 16}
+_ADDRESS_BITS = {4: 32, 6: 128}
+
+# 单次变更超过 max(该值, 条目数 / _REBUILD_RATIO) 时整体重建区间索引，而非逐条插入或删除
+_REBUILD_THRESHOLD = 64
+_REBUILD_RATIO = 100
+
+# 变更日志保留的条目数，版本早于最旧的条目时需要全量同步
+DEFAULT_LOG_SIZE = 65536
+
+_OP_ADD = 1
+_OP_REMOVE = 2
+
+
+def parse_ip(ip):
+    """解析单个 IP，返回 (地址族, 整数地址)"""
+    family = 6 if ":" in ip else 4
+    try:
+        packed = socket.inet_pton(_ADDRESS_FAMILIES[family], ip.strip())
+    except OSError:
+        raise ValueError("无效的 IP: %s" % ip)
+    return family, int.from_bytes(packed, "big")
+
+
+def format_ip(family, value):
+    return socket.inet_ntop(_ADDRESS_FAMILIES[family], value.to_bytes(_ADDRESS_BYTES[family], "big"))
+
+
+def parse_entry(entry):
+    """解析封禁条目，返回 (地址族, 起始地址, 结束地址)
+
+    支持单个 IP（1.2.3.4）、CIDR（1.2.3.0/24）与范围（1.2.3.4-1.2.3.9），IPv4 与 IPv6 均可。
+    """
+    entry = entry.strip()
+    if "/" in entry:
+        try:
+            network = ipaddress.ip_network(entry, strict=False)
+        except ValueError:
+            raise ValueError("无效的 CIDR: %s" % entry)
+        return network.version, int(network.network_address), int(network.broadcast_address)
+    if "-" in entry:
+        first, _, last = entry.partition("-")
+        family, start = parse_ip(first)
+        last_family, end = parse_ip(last)
+        if family != last_family or start > end:
+            raise ValueError("无效的 IP 范围: %s" % entry)
+        return family, start, end
+    family, value = parse_ip(entry)
+    return family, value, value
+
+
+def entry_hash(key):
+    """规范条目的 64 位哈希，全部条目的哈希异或即为封禁列表的摘要"""
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def format_entry(family, start, end):
+    """返回范围的规范表示：单个 IP、CIDR，或无法用 CIDR 表示时的 起始-结束"""
+    if start == end:
+        return format_ip(family, start)
+    size = end - start + 1
+    if size & (size - 1) == 0 and start % size == 0:
+        prefix = _ADDRESS_BITS[family] - (size.bit_length() - 1)
+        return "%s/%d" % (format_ip(family, start), prefix)
+    return "%s-%s" % (format_ip(family, start), format_ip(family, end))
+
+
+class IntervalSet:
+    """有序、合并后的闭区间集合
+
+    相交或相邻的区间会被合并，包含判断为 O(log n)。
+    """
+
+    __slots__ = ("starts", "ends")
+
+    def __init__(self):
+        self.starts: list[int] = []
+        self.ends: list[int] = []
+
+    @classmethod
+    def from_ranges(cls, ranges):
+        """由任意顺序的 (起始, 结束) 构建"""
+        interval_set = cls()
+        starts = interval_set.starts
+        ends = interval_set.ends
+        for start, end in sorted(ranges):
+            if ends and start <= ends[-1] + 1:
+                if end > ends[-1]:
+                    ends[-1] = end
+            else:
+                starts.append(start)
+                ends.append(end)
+        return interval_set
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __iter__(self):
+        return zip(self.starts, self.ends)
+
+    def __contains__(self, value):
+        index = bisect_right(self.starts, value) - 1
+        return index >= 0 and self.ends[index] >= value
+
+    def within(self, start, end):
+        """产生与 [start, end] 相交的区间，截取到 [start, end] 之内"""
+        index = bisect_left(self.ends, start)
+        starts = self.starts
+        ends = self.ends
+        while index < len(starts) and starts[index] <= end:
+            yield max(starts[index], start), min(ends[index], end)
+            index += 1
+
+    def overlaps(self, start, end) -> bool:
+        index = bisect_left(self.ends, start)
+        return index < len(self.starts) and self.starts[index] <= end
+
+    def difference(self, other):
+        """返回不在 other 中的部分，两者均已有序，开销与两者的区间数之和成正比"""
+        result = IntervalSet()
+        other_starts = other.starts
+        other_ends = other.ends
+        index = 0
+        for start, end in self:
+            while index < len(other_starts) and other_ends[index] < start:
+                index += 1
+            position = index
+            while position < len(other_starts) and other_starts[position] <= end:
+                if other_starts[position] > start:
+                    result.starts.append(start)
+                    result.ends.append(other_starts[position] - 1)
+                start = other_ends[position] + 1
+                if start > end:
+                    break
+                position += 1
+            if start <= end:
+                result.starts.append(start)
+                result.ends.append(end)
+        return result
+
+    def add(self, start, end):
+        # 与 [start, end] 相交或相邻的区间为 [i, j)
+        i = bisect_left(self.ends, start - 1)
+        j = bisect_right(self.starts, end + 1)
+        if i < j:
+            start = min(start, self.starts[i])
+            end = max(end, self.ends[j - 1])
+        self.starts[i:j] = [start]
+        self.ends[i:j] = [end]
+
+    def remove(self, start, end):
+        # 与 [start, end] 相交的区间为 [i, j)
+        i = bisect_left(self.ends, start)
+        j = bisect_right(self.starts, end)
+        if i >= j:
+            return
+        starts = []
+        ends = []
+        if self.starts[i] < start:
+            starts.append(self.starts[i])
+            ends.append(start - 1)
+        if self.ends[j - 1] > end:
+            starts.append(end + 1)
+            ends.append(self.ends[j - 1])
+        self.starts[i:j] = starts
+        self.ends[i:j] = ends
+
+
+class Blocklist:
+    """IP 封禁列表
+
+    保存调用方提交的条目（单个 IP、CIDR 或范围，均转换为规范表示），
+    并按地址族维护合并后的区间索引，用于生成最少的 libtorrent 过滤规则与快速判断 IP 是否被封禁。
+    带有过期时间的条目由最小堆按到期顺序管理。
+
+    每次产生效果的变更使版本号加一，并按版本记录到有界的变更日志中，
+    调用方凭版本只获取此后新增与移除的条目；摘要为全部规范条目哈希的异或，随条目增删增量维护。
+    """
+
+    def __init__(self, log_size=DEFAULT_LOG_SIZE):
+        # 规范条目 -> (地址族, 起始地址, 结束地址)
+        self._entries: dict[str, tuple] = {}
+        # 覆盖多个地址的条目，解封时只需在其中查找部分重叠的条目
+        self._wide: dict[str, tuple] = {}
+        self._intervals = {4: IntervalSet(), 6: IntervalSet()}
+        # 规范条目 -> 过期时间戳（整数秒），永久封禁的条目不在其中
+        self._expires: dict[str, int] = {}
+        # (过期时间戳, 规范条目)，条目被解封或过期时间变更后，旧记录在出堆时丢弃
+        self._expiry_heap: list[tuple] = []
+        self.epoch = new_epoch()
+        self.version = 0
+        # 全部规范条目哈希的异或
+        self._digest = 0
+        # (版本, 操作, 规范条目, (地址族, 起始地址, 结束地址))
+        self._log = deque(maxlen=log_size)
+        # 日志之外（载入时）的最小可同步版本
+        self._base_version = 0
+        # 本次变更是否已记录到日志，变更结束时推进版本
+        self._dirty = False
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __contains__(self, entry):
+        return entry in self._entries
+
+    @property
+    def rule_count(self) -> int:
+        """合并后的区间数量，即 libtorrent 过滤规则数量"""
+        return len(self._intervals[4]) + len(self._intervals[6])
+
+    def covers(self, ip) -> bool:
+        """判断 IP 是否被封禁"""
+        try:
+            family, value = parse_ip(ip)
+        except ValueError:
+            return False
+        return value in self._intervals[family]
+
+    @property
+    def digest(self) -> str:
+        """封禁列表内容的摘要（十六进制），与条目顺序和过期时间无关"""
+        return "%016x" % self._digest
+
+    @property
+    def floor(self) -> int:
+        """仍可进行增量同步的最小版本"""
+        if len(self._log) < self._log.maxlen:
+            return self._base_version
+        # 日志已满时最旧版本的记录可能不完整
+        return self._log[0][0]
+
+    @property
+    def cursor(self) -> str:
+        return format_cursor(self.epoch, self.version)
+
+    def parse_cursor(self, cursor):
+        """解析 cursor，返回其中的版本，纪元不一致、格式无效或已过期时返回 None"""
+        return parse_cursor(cursor, self.epoch, self.floor, self.version)
+
+    def changes(self, since):
+        """返回自版本 since 以来的变更
+
+        同一条目在期间多次变更时只按最后一次返回；过期时间变更按新增返回。
+
+        Returns:
+            (新增的规范条目列表, 移除的规范条目列表)，版本无效或已过期时返回 None
+        """
+        latest = self._changed(since)
+        if latest is None:
+            return None
+        added = [key for key, (op, _) in latest.items() if op == _OP_ADD]
+        removed = [key for key, (op, _) in latest.items() if op == _OP_REMOVE]
+        return added, removed
+
+    def changed_ranges(self, since):
+        """返回自版本 since 以来变更过的 (地址族, 起始地址, 结束地址)，版本无效或已过期时返回 None"""
+        latest = self._changed(since)
+        if latest is None:
+            return None
+        return [parsed for _, parsed in latest.values()]
+
+    def _changed(self, since):
+        if since < self.floor or since > self.version:
+            return None
+        latest = {}
+        for _, op, key, parsed in entries_since(self._log, since):
+            latest.setdefault(key, (op, parsed))
+        return latest
+
+    def rules_within(self, family, start, end):
+        """产生 [start, end] 之内合并后的 (起始 IP, 结束 IP)，用于增量更新 ip_filter"""
+        for first, last in self._intervals[family].within(start, end):
+            yield format_ip(family, first), format_ip(family, last)
+
+    @property
+    def expires(self) -> dict:
+        """规范条目 -> 过期时间戳"""
+        return self._expires
+
+    def next_expiry(self):
+        """最早的过期时间戳，没有带过期时间的条目时返回 None"""
+        heap = self._expiry_heap
+        while heap and self._expires.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)
+        return heap[0][0] if heap else None
+
+    def rules(self):
+        """产生合并后的 (起始 IP, 结束 IP)，用于 ip_filter.add_rule"""
+        for family, intervals in self._intervals.items():
+            for start, end in intervals:
+                yield format_ip(family, start), format_ip(family, end)
+
+    def add_ranges(self, ranges, expires_at=None):
+        """新增 (地址族, 起始地址, 结束地址)，返回实际新增的规范条目列表
+
+        Args:
+            ranges (list[tuple]): 由 parse_entries 解析的范围
+            expires_at (int): 过期时间戳（整数秒），为空表示永久封禁；对已存在的条目同样生效
+        """
+        added = []
+        for parsed in ranges:
+            key = format_entry(*parsed)
+            if key in self._entries:
+                if self._expires.get(key) != expires_at:
+                    self._set_expiry(key, expires_at)
+                    self._record(_OP_ADD, key, parsed)
+                continue
+            self._put(key, parsed)
+            self._set_expiry(key, expires_at)
+            added.append(key)
+
+        self._update_intervals([self._entries[key] for key in added], [])
+        self._commit()
+        return added
+
+    def remove_ranges(self, ranges):
+        """解封 (地址族, 起始地址, 结束地址)，返回实际产生效果的规范条目列表
+
+        完全被解封范围覆盖的条目会被删除；与解封范围部分重叠的条目会被拆分，只保留未解封的部分。
+        """
+        removed = []
+        for parsed in ranges:
+            family, start, end = parsed
+            intervals = self._intervals[family]
+            if not intervals.overlaps(start, end):
+                continue
+
+            key = format_entry(*parsed)
+            # 单个 IP 只可能与同一条目或覆盖多个地址的条目重叠
+            candidates = self._wide if start == end else self._entries
+            overlapping = [
+                item for item in candidates.items()
+                if item[1][0] == family and item[1][1] <= end and item[1][2] >= start
+            ]
+            if key in self._entries and key not in candidates:
+                overlapping.append((key, self._entries[key]))
+
+            for other_key, (_, other_start, other_end) in overlapping:
+                # 拆分后的部分沿用原条目的过期时间
+                expires_at = self._expires.get(other_key)
+                self._pop(other_key)
+                if other_start < start:
+                    self._put_piece(family, other_start, start - 1, expires_at)
+                if other_end > end:
+                    self._put_piece(family, end + 1, other_end, expires_at)
+
+            intervals.remove(start, end)
+            removed.append(key)
+        self._commit()
+        return removed
+
+    def discard_ranges(self, ranges):
+        """删除与 (地址族, 起始地址, 结束地址) 完全一致的条目，不拆分重叠的条目
+
+        Returns:
+            被删除的规范条目列表
+        """
+        removed = []
+        removed_ranges = []
+        for parsed in ranges:
+            key = format_entry(*parsed)
+            existing = self._entries.get(key)
+            if existing is None:
+                continue
+            self._pop(key)
+            removed.append(key)
+            removed_ranges.append(existing)
+        self._update_intervals([], removed_ranges)
+        self._commit()
+        return removed
+
+    def replace(self, entries):
+        """全量替换封禁条目，只应用与当前条目的差异，保留的条目沿用原有的过期时间
+
+        Returns:
+            (新增的规范条目列表, 移除的规范条目列表)
+        """
+        entries_map = self._entries
+        target = {}
+        unparsed = []
+        for entry in entries:
+            # 已是规范表示的现有条目无需再次解析
+            parsed = entries_map.get(entry) if isinstance(entry, str) else None
+            if parsed is not None:
+                target[entry] = parsed
+            else:
+                unparsed.append(entry)
+        for parsed in self.parse_entries(unparsed):
+            target[format_entry(*parsed)] = parsed
+        removed = [key for key in entries_map if key not in target]
+        added = [key for key in target if key not in entries_map]
+
+        removed_ranges = [entries_map[key] for key in removed]
+        for key in removed:
+            self._pop(key)
+        for key in added:
+            self._put(key, target[key])
+
+        self._update_intervals([target[key] for key in added], removed_ranges)
+        self._commit()
+        return added, removed
+
+    def records(self):
+        """按地址族与起始地址排序，产生 (地址族, 起始地址, 结束地址, 过期时间戳或 None)"""
+        for key, (family, start, end) in sorted(self._entries.items(), key=lambda item: item[1]):
+            yield family, start, end, self._expires.get(key)
+
+    def load(self, records):
+        """批量载入 (地址族, 起始地址, 结束地址, 过期时间戳或 None)，替换现有条目"""
+        self._entries.clear()
+        self._wide.clear()
+        self._expires.clear()
+        self._expiry_heap = []
+        self._digest = 0
+        for family, start, end, expires_at in records:
+            self._put_range(family, start, end, expires_at)
+        self._rebuild()
+        # 整体替换后此前的版本均无法增量同步
+        self._log.clear()
+        self._dirty = False
+        self.version += 1
+        self._base_version = self.version
+
+    def restore_expires(self, expires):
+        """恢复持久化的过期时间
+
+        Args:
+            expires (dict[str, float]): 规范条目 -> 过期时间戳
+        """
+        for key, expires_at in expires.items():
+            if key in self._entries:
+                self._set_expiry(key, int(math.ceil(expires_at)))
+
+    def expire(self, now):
+        """移除所有已过期的条目，返回被移除的规范条目列表"""
+        expired = []
+        expired_ranges = []
+        heap = self._expiry_heap
+        while heap and heap[0][0] <= now:
+            expires_at, key = heapq.heappop(heap)
+            if self._expires.get(key) == expires_at:
+                expired_ranges.append(self._entries[key])
+                self._pop(key)
+                expired.append(key)
+        self._update_intervals([], expired_ranges)
+        self._commit()
+        return expired
+
+    @staticmethod
+    def _parse(entry):
+        try:
+            return parse_entry(entry)
+        except (AttributeError, ValueError) as ex:
+            log.warning("PeerBanHelperAdapter: 忽略无效的封禁条目 %r: %s", entry, ex)
+            return None
+
+    def parse_entries(self, entries):
+        """解析封禁条目，返回 [(地址族, 起始地址, 结束地址)]，无效条目被忽略"""
+        parsed = (self._parse(entry) for entry in entries)
+        return [item for item in parsed if item is not None]
+
+    def _put(self, key, parsed):
+        if key not in self._entries:
+            self._digest ^= entry_hash(key)
+            self._record(_OP_ADD, key, parsed)
+        self._entries[key] = parsed
+        if parsed[1] != parsed[2]:
+            self._wide[key] = parsed
+
+    def _put_range(self, family, start, end, expires_at=None):
+        parsed = (family, start, end)
+        key = format_entry(*parsed)
+        self._put(key, parsed)
+        self._set_expiry(key, expires_at)
+
+    def _put_piece(self, family, start, end, expires_at):
+        """加入拆分后的部分，与已有条目相同时保留更晚的过期时间（永久封禁优先）"""
+        parsed = (family, start, end)
+        key = format_entry(*parsed)
+        if key not in self._entries:
+            self._put(key, parsed)
+            self._set_expiry(key, expires_at)
+            return
+        current = self._expires.get(key)
+        if current is None or (expires_at is not None and expires_at <= current):
+            return
+        self._set_expiry(key, expires_at)
+        self._record(_OP_ADD, key, parsed)
+
+    def _set_expiry(self, key, expires_at):
+        if expires_at is None:
+            self._expires.pop(key, None)
+            return
+        self._expires[key] = expires_at
+        heapq.heappush(self._expiry_heap, (expires_at, key))
+        if len(self._expiry_heap) > 2 * len(self._expires) + 64:
+            # 失效记录过多时重建堆
+            self._expiry_heap = [(v, k) for k, v in self._expires.items()]
+            heapq.heapify(self._expiry_heap)
+
+    def _pop(self, key):
+        parsed = self._entries.pop(key, None)
+        if parsed is not None:
+            self._digest ^= entry_hash(key)
+            self._record(_OP_REMOVE, key, parsed)
+        self._wide.pop(key, None)
+        self._expires.pop(key, None)
+
+    def _record(self, op, key, parsed):
+        self._log.append((self.version + 1, op, key, parsed))
+        self._dirty = True
+
+    def _commit(self):
+        """变更结束，存在已记录的变更时推进版本"""
+        if self._dirty:
+            self._dirty = False
+            self.version += 1
+
+    def _update_intervals(self, added, removed):
+        """按新增与移除的 (地址族, 起始地址, 结束地址) 更新区间索引，变更较多时整体重建"""
+        if not added and not removed:
+            return
+        threshold = max(_REBUILD_THRESHOLD, len(self._entries) // _REBUILD_RATIO)
+        # 移除覆盖多个地址的条目时，其中的其他条目需要重新加入，只能重建
+        if len(added) + len(removed) > threshold or any(start != end for _, start, end in removed):
+            self._rebuild()
+            return
+
+        if removed:
+            removed_values = {family: set() for family in self._intervals}
+            for family, value, _ in removed:
+                self._intervals[family].remove(value, value)
+                removed_values[family].add(value)
+            # 单个 IP 只可能与覆盖多个地址的条目重叠，将其重新加入
+            for family, start, end in self._wide.values():
+                if any(start <= value <= end for value in removed_values[family]):
+                    self._intervals[family].add(start, end)
+        for family, start, end in added:
+            self._intervals[family].add(start, end)
+
+    def _rebuild(self):
+        for family in self._intervals:
+            self._intervals[family] = IntervalSet.from_ranges(
+                (start, end) for entry_family, start, end in self._entries.values() if entry_family == family
+            )
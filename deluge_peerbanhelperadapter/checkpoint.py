@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2024 azicen <chenjiazi2000@outlook.com>
+#
+# This file is part of PeerBanHelperAdapter and is licensed under MIT license, or later,
+# with the additional special exception to link portions of this program with
+# the OpenSSL library. See LICENSE for more details.
+from __future__ import unicode_literals
+
+import json
+import logging
+import os
+
+log = logging.getLogger(__name__)
+
+
+class Checkpoint:
+    """以原子替换方式写入的小型 JSON 检查点文件
+
+    先写入临时文件并刷盘，再替换原文件，任意时刻中断都只会留下完整的旧文件或新文件。
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def read(self):
+        """读取检查点，不存在或已损坏时返回 None"""
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as ex:
+            log.error("PeerBanHelperAdapter: 无法读取检查点 %s: %s", self.path, ex)
+            return None
+
+    def write(self, data):
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2024 azicen <chenjiazi2000@outlook.com>
+#
+# This file is part of PeerBanHelperAdapter and is licensed under MIT license, or later,
+# with the additional special exception to link portions of this program with
+# the OpenSSL library. See LICENSE for more details.
+from __future__ import unicode_literals
+
+from functools import lru_cache
+from operator import attrgetter, itemgetter
+
+from deluge.common import decode_bytes
+
+from deluge_peerbanhelperadapter.model.torrent import ACTIVE_TORRENT_FIELDS, PEER_FIELDS
+
+# 节点列表的响应格式
+PEER_FORMAT_DICT = "dict"  # 每个节点一个字典
+PEER_FORMAT_ROWS = "rows"  # 每个节点一个数组，字段顺序与 peer_fields 一致
+PEER_FORMAT_COLUMNS = "columns"  # 每个字段一个数组，字段顺序与 peer_fields 一致
+PEER_FORMATS = (PEER_FORMAT_DICT, PEER_FORMAT_ROWS, PEER_FORMAT_COLUMNS)
+
+
+# 解码缓存容量：节点 ID 与连接一一对应，客户端名称种类很少
+PEER_ID_CACHE_SIZE = 65536
+CLIENT_NAME_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=PEER_ID_CACHE_SIZE)
+def _peer_id(raw):
+    # 与 str(sha1_hash) 相同的十六进制表示
+    return raw.hex()
+
+
+@lru_cache(maxsize=CLIENT_NAME_CACHE_SIZE)
+def _client_name(raw):
+    try:
+        return decode_bytes(raw)
+    except UnicodeDecodeError:
+        return "unknown"
+
+
+def decode_cache_info():
+    """返回节点 ID 与客户端名称解码缓存的命中统计"""
+    info = {}
+    for name, cached in (("peer_id", _peer_id), ("client_name", _client_name)):
+        hits, misses, maxsize, size = cached.cache_info()
+        total = hits + misses
+        info[name] = {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / total if total else 0.0,
+            "size": size,
+            "maxsize": maxsize,
+        }
+    return info
+
+
+# Peer 字段 -> 从 libtorrent peer_info（p）读取该字段的表达式，用于生成 peer_row_builder
+_PEER_EXPRESSIONS = {name: "p." + name for name in PEER_FIELDS}
+_PEER_EXPRESSIONS.update({
+    "ip": "p.ip[0]",
+    "port": "p.ip[1]",
+    # 以原始字节为键缓存解码结果，重复出现的节点无需再次解码
+    "peer_id": "_peer_id(p.pid.to_bytes())",
+    "client_name": "_client_name(p.client)",
+    "local_endpoint_ip": "p.local_endpoint[0]",
+    "local_endpoint_port": "p.local_endpoint[1]",
+})
+
+# Peer 字段 -> 从 libtorrent peer_info 读取该字段的函数，与 _PEER_EXPRESSIONS 一致，用于节点过滤条件
+_PEER_GETTERS = {name: attrgetter(name) for name in PEER_FIELDS}
+_PEER_GETTERS.update({
+    "ip": lambda p: p.ip[0],
+    "port": lambda p: p.ip[1],
+    "peer_id": lambda p: _peer_id(p.pid.to_bytes()),
+    "client_name": lambda p: _client_name(p.client),
+    "local_endpoint_ip": lambda p: p.local_endpoint[0],
+    "local_endpoint_port": lambda p: p.local_endpoint[1],
+})
+
+
+@lru_cache(maxsize=32)
+def peer_row_builder(peer_fields):
+    """返回按 peer_fields 顺序直接构造节点元组的函数
+
+    与 namedtuple 的做法相同，生成一个字面量元组表达式，
+    每个节点只需一次函数调用，不再逐字段调用 getter 或构造中间对象。
+
+    Args:
+        peer_fields (tuple[str]): 已协商的节点字段
+    """
+    expression = "(" + "".join(_PEER_EXPRESSIONS[name] + ", " for name in peer_fields) + ")"
+    return eval("lambda p: " + expression, {"_peer_id": _peer_id, "_client_name": _client_name})
+
+
+@lru_cache(maxsize=32)
+def row_projector(source_fields, target_fields):
+    """返回将 source_fields 顺序的节点元组投影为 target_fields 顺序的函数
+
+    Args:
+        source_fields (tuple[str]): 原始节点元组的字段
+        target_fields (tuple[str]): 需要的字段，必须是 source_fields 的子集
+    """
+    if source_fields == target_fields:
+        return None
+    indices = [source_fields.index(name) for name in target_fields]
+    if len(indices) == 1:
+        index = indices[0]
+        return lambda row: (row[index],)
+    if not indices:
+        return lambda row: ()
+    return itemgetter(*indices)
+
+
+def _bind(test, getters):
+    """返回以 getters 读取的字段值调用 test 的函数"""
+    if len(getters) == 1:
+        getter = getters[0]
+        return lambda value: test(getter(value))
+    return lambda value: test(*[getter(value) for getter in getters])
+
+
+class PeerFilter:
+    """节点过滤条件
+
+    每个条件由所需的 Peer 字段与以这些字段值为参数的判断函数组成，
+    可分别组合为作用于 libtorrent peer_info 与作用于完整节点元组的判断函数。
+    """
+
+    __slots__ = ("conditions",)
+
+    def __init__(self, conditions):
+        # [(Peer 字段名元组, 判断函数)]，全部满足时保留节点
+        self.conditions = conditions
+
+    def _predicate(self, getter):
+        checks = [_bind(test, [getter(name) for name in fields]) for fields, test in self.conditions]
+        if len(checks) == 1:
+            return checks[0]
+        return lambda value: all(check(value) for check in checks)
+
+    def peer_info_predicate(self):
+        """返回判断 libtorrent peer_info 是否保留的函数"""
+        return self._predicate(_PEER_GETTERS.__getitem__)
+
+    def row_predicate(self, peer_fields=PEER_FIELDS):
+        """返回判断 peer_fields 顺序的节点元组是否保留的函数"""
+        return self._predicate(lambda name: itemgetter(peer_fields.index(name)))
+
+
+# parse_peer_filter 支持的过滤条件
+_PEER_FILTER_KEYS = frozenset((
+    "min_transfer",
+    "min_speed",
+    "exclude_blocklisted",
+    "client_prefixes",
+    "flags_all",
+    "flags_none",
+    "families",
+))
+
+
+def _at_least(minimum):
+    return lambda first, second: first + second >= minimum
+
+
+def parse_peer_filter(peer_filter, blocklist=None):
+    """解析节点过滤条件，未指定任何条件时返回 None
+
+    Args:
+        peer_filter (dict): 过滤条件，均为可选：
+            min_transfer (int): 上传量与下载量之和的下限
+            min_speed (int): 上传速度与下载速度之和的下限
+            exclude_blocklisted (bool): 排除已在封禁列表中的节点
+            client_prefixes (list[str]): 客户端名称前缀，满足其一即保留
+            flags_all (int): 必须全部设置的 flags 位
+            flags_none (int): 必须全部未设置的 flags 位
+            families (list[int]): 保留的 IP 地址族，4 和/或 6
+        blocklist (Blocklist): exclude_blocklisted 使用的封禁列表
+    """
+    if not peer_filter:
+        return None
+    unknown = set(peer_filter) - _PEER_FILTER_KEYS
+    if unknown:
+        raise ValueError("不支持的节点过滤条件: %s" % ", ".join(sorted(unknown)))
+
+    conditions = []
+    if peer_filter.get("min_transfer"):
+        conditions.append((("total_upload", "total_download"), _at_least(int(peer_filter["min_transfer"]))))
+    if peer_filter.get("min_speed"):
+        conditions.append((("up_speed", "down_speed"), _at_least(int(peer_filter["min_speed"]))))
+    if peer_filter.get("exclude_blocklisted") and blocklist is not None and len(blocklist) > 0:
+        covers = blocklist.covers
+        conditions.append((("ip",), lambda ip: not covers(ip)))
+    if peer_filter.get("client_prefixes"):
+        prefixes = tuple(str(prefix) for prefix in peer_filter["client_prefixes"])
+        conditions.append((("client_name",), lambda client_name: client_name.startswith(prefixes)))
+    if peer_filter.get("flags_all"):
+        flags_all = int(peer_filter["flags_all"])
+        conditions.append((("flags",), lambda flags: flags & flags_all == flags_all))
+    if peer_filter.get("flags_none"):
+        flags_none = int(peer_filter["flags_none"])
+        conditions.append((("flags",), lambda flags: not flags & flags_none))
+    families = set(int(family) for family in peer_filter.get("families") or ())
+    if families - {4, 6}:
+        raise ValueError("不支持的 IP 地址族: %s" % peer_filter["families"])
+    if families == {4}:
+        conditions.append((("ip",), lambda ip: ":" not in ip))
+    elif families == {6}:
+        conditions.append((("ip",), lambda ip: ":" in ip))
+
+    if not conditions:
+        return None
+    return PeerFilter(conditions)
+
+
+class TorrentSource:
+    """单个种子的数据来源"""
+
+    __slots__ = ("torrent_id", "torrent", "status", "info")
+
+    def __init__(self, torrent_id, torrent, status, info):
+        self.torrent_id = torrent_id
+        # deluge.core.torrent.Torrent
+        self.torrent = torrent
+        # LT torrent_status
+        self.status = status
+        # TorrentStaticInfo
+        self.info = info
+
+
+# ActiveTorrent 字段 -> 从 TorrentSource 读取该字段的函数
+TORRENT_GETTERS = {
+    "id": lambda source: source.torrent_id,
+    "name": lambda source: source.info.name,
+    "info_hash": lambda source: source.torrent_id,
+    # 与 Torrent.get_progress 相同，但读取本次批量获取的状态
+    "progress": lambda source: source.status.progress * 100,
+    "size": lambda source: source.info.size,
+    "completed_size": lambda source: source.status.num_pieces * source.info.piece_length,
+    "priv": lambda source: source.info.priv,
+    "upload_payload_rate": lambda source: source.status.upload_payload_rate,
+    "download_payload_rate": lambda source: source.status.download_payload_rate,
+}
+
+
+def resolve_fields(requested, supported):
+    """协商字段，忽略不支持的字段并保持调用方给出的顺序
+
+    Args:
+        requested (list[str]): 调用方需要的字段，为空时返回全部字段
+        supported (tuple[str]): 支持的全部字段
+    """
+    if not requested:
+        return supported
+    resolved = []
+    for name in requested:
+        if name in supported and name not in resolved:
+            resolved.append(name)
+    return tuple(resolved)
+
+
+def resolve_peer_fields(peer_fields=None):
+    """协商节点字段，参见 resolve_fields"""
+    return resolve_fields(peer_fields, PEER_FIELDS)
+
+
+def resolve_torrent_fields(torrent_fields=None, supported=ACTIVE_TORRENT_FIELDS):
+    """协商种子字段，参见 resolve_fields"""
+    return resolve_fields(torrent_fields, supported)
+
+
+def encode_peers(rows, peer_fields, peer_format):
+    """将节点行数据编码为指定的响应格式
+
+    Args:
+        rows (list[tuple]): 节点行数据，字段顺序与 peer_fields 一致
+        peer_fields (tuple[str]): 字段名
+        peer_format (str): PEER_FORMATS 之一
+    """
+    if peer_format == PEER_FORMAT_ROWS:
+        return rows
+    if peer_format == PEER_FORMAT_COLUMNS:
+        if not rows:
+            return [[] for _ in peer_fields]
+        return [list(column) for column in zip(*rows)]
+    return [dict(zip(peer_fields, row)) for row in rows]
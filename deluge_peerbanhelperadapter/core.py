@@ -9,31 +9,108 @@
 from __future__ import unicode_literals
 
 import logging
+import math
+import time
+import uuid
 
-from deluge._libtorrent import lt
 import deluge.component as component
-from deluge.core.filtermanager import FilterManager
 from deluge.core.torrentmanager import TorrentManager
 import deluge.configmanager
 from deluge.core.rpcserver import export
-from deluge.common import decode_bytes
+from deluge._libtorrent import lt
 from deluge.plugins.pluginbase import CorePluginBase
-from deluge.ui.client import client
-from datetime import datetime
-
-from deluge_peerbanhelperadapter.model.stats import SessionStatus, PersistenceStatus, LT_STATUS_NAMES
-from deluge_peerbanhelperadapter.model.torrent import ActiveTorrent, Peer, Torrent
+from twisted.internet import reactor
+from twisted.internet.task import LoopingCall
+
+from deluge_peerbanhelperadapter.acquisition import TorrentAcquirer
+from deluge_peerbanhelperadapter.blocklist import Blocklist, format_entry
+from deluge_peerbanhelperadapter.checkpoint import Checkpoint
+from deluge_peerbanhelperadapter.collector import (
+    PEER_FORMAT_DICT,
+    PEER_FORMATS,
+    TORRENT_GETTERS,
+    decode_cache_info,
+    encode_peers,
+    parse_peer_filter,
+    peer_row_builder,
+    resolve_peer_fields,
+    resolve_torrent_fields,
+)
+from deluge_peerbanhelperadapter.instrumentation import AdapterMetrics, timed
+from deluge_peerbanhelperadapter.ipfilter import IpFilterApplier
+from deluge_peerbanhelperadapter.metrics import MetricReader, available_metrics
+from deluge_peerbanhelperadapter.model.stats import (
+    GAUGE_COUNTERS,
+    LT_RATE_NAMES,
+    LT_STATUS_NAMES,
+    PersistenceStatus,
+    SessionStatus,
+    combine_rates,
+)
+from deluge_peerbanhelperadapter.model.torrent import ACTIVE_TORRENT_FIELDS, PEER_FIELDS, TORRENT_FIELDS
+from deluge_peerbanhelperadapter.pagination import Paginator
+from deluge_peerbanhelperadapter.peerhistory import PeerHistory
+from deluge_peerbanhelperadapter.peerindex import PeerIndex
+from deluge_peerbanhelperadapter.peerregistry import PeerRegistry
+from deluge_peerbanhelperadapter.sampler import SessionSampler
+from deluge_peerbanhelperadapter.snapshot import SnapshotCache
+from deluge_peerbanhelperadapter.store import BlocklistStore
+from deluge_peerbanhelperadapter.timeseries import RESOLUTIONS, TimeSeriesStore
+from deluge_peerbanhelperadapter.worker import SnapshotWorker
 
 log = logging.getLogger(__name__)
 
+# 分页查询默认每页节点数
+DEFAULT_PAGE_SIZE = 5000
+
+# 封禁列表保存在独立的二进制文件中（参见 BlocklistStore）
+BLOCKLIST_FILENAME = "peerbanhelper_adapter.blocklist"
+# 会话统计时间序列文件名前缀，每种时间粒度一个文件（参见 TimeSeriesStore）
+STATS_FILENAME = "peerbanhelper_adapter.stats"
+# 封禁过期定时器的时间窗口（秒），窗口内到期的条目一并移除
+EXPIRY_WINDOW = 1
+# 会话统计历史查询默认返回的记录数
+DEFAULT_HISTORY_POINTS = 60
+# 本次会话尚未合并到历史状态的统计增量（参见 Checkpoint）
+CHECKPOINT_FILENAME = "peerbanhelper_adapter.checkpoint"
+
+# 旧版本保存在配置中的封禁列表，仅用于迁移
 CONF_KEY_BLOCKLIST = "blocklist"
+# 旧版本保存在配置中的封禁条目 -> 过期时间戳，仅用于迁移
+CONF_KEY_BLOCKLIST_EXPIRES = "blocklist_expires"
 CONF_KEY_HISTORY_STATUS = "history_status"
+# 旧版本异常中断时保存的会话状态，仅用于恢复
 CONF_KEY_SESSION_STATUS = "session_status"
+# 最后一次合并到历史状态的检查点 ID，防止重复合并
+CONF_KEY_MERGED_CHECKPOINT = "merged_checkpoint"
+# 节点事件所需的 alert 类别（Deluge 默认未订阅）
+PEER_ALERT_CATEGORIES = lt.alert.category_t.connect_notification | lt.alert.category_t.peer_notification
+
+# 后台快照采集间隔（秒），0 表示禁用，RPC 调用时同步采集
+CONF_KEY_SNAPSHOT_INTERVAL = "snapshot_interval"
+# 会话统计采集间隔（秒）
+CONF_KEY_SESSION_STATS_INTERVAL = "session_stats_interval"
+# 每个节点保留的采样数，小于 2 表示不记录节点采样
+CONF_KEY_PEER_HISTORY_SAMPLES = "peer_history_samples"
+# 除 LT_STATUS_NAMES 外额外采集的 libtorrent 会话统计名称
+CONF_KEY_EXTRA_METRICS = "extra_metrics"
+# 会话统计检查点写入间隔（秒），0 表示只在停用时保存
+CONF_KEY_CHECKPOINT_INTERVAL = "checkpoint_interval"
+# 是否记录各阶段耗时与计数（参见 get_adapter_metrics）
+CONF_KEY_INSTRUMENTATION = "instrumentation"
 
 DEFAULT_PREFS = {
     CONF_KEY_BLOCKLIST: [],
+    CONF_KEY_BLOCKLIST_EXPIRES: {},
     CONF_KEY_HISTORY_STATUS: {},
     CONF_KEY_SESSION_STATUS: {},
+    CONF_KEY_SNAPSHOT_INTERVAL: 0,
+    CONF_KEY_SESSION_STATS_INTERVAL: 5,
+    CONF_KEY_PEER_HISTORY_SAMPLES: 8,
+    CONF_KEY_EXTRA_METRICS: [],
+    CONF_KEY_CHECKPOINT_INTERVAL: 60,
+    CONF_KEY_MERGED_CHECKPOINT: "",
+    CONF_KEY_INSTRUMENTATION: True,
 }
 
 
@@ -43,26 +120,40 @@ class Core(CorePluginBase):
     # 历史状态信息
     history_status: PersistenceStatus
 
-    filtermanager: FilterManager
     torrentmanager: TorrentManager
 
-    blocklist: set[str] = set()
+    blocklist: Blocklist
 
     def enable(self):
         log.debug("PeerBanHelperAdapter: Plugin enabled...")
 
+        # 各阶段耗时与计数，导出方法调用前必须存在
+        self.metrics = AdapterMetrics()
+
         self.session_status = SessionStatus()
+        # 启用后首次采样的会话状态，本次启用只统计此后的增量
+        self.session_baseline = None
+        # 活跃种子快照，用于增量查询
+        self.snapshot_cache = SnapshotCache()
+        # 分页查询游标
+        self.paginator = Paginator()
 
         # 获取 libtorrent.session
         self.session = component.get("Core").session
-        # 获取 deluge.core.filtermanager.FilterManager 实例
-        self.filtermanager = component.get("FilterManager")
         # 获取 deluge.core.torrentmanager.TorrentManager 实例
         self.torrentmanager = component.get("TorrentManager")
+        # 批量获取种子状态，种子元数据缓存由 Deluge 种子事件失效
+        self.acquirer = TorrentAcquirer(self.session, self.torrentmanager)
+        event_manager = component.get("EventManager")
+        for event, handler in self.acquirer.handlers().items():
+            event_manager.register_event_handler(event, handler)
+        # 节点 IP -> 种子索引，由每次节点采集维护
+        self.peer_index = PeerIndex()
 
         self.config = deluge.configmanager.ConfigManager(
             "peerbanhelper_adapter.conf", DEFAULT_PREFS
         )
+        self.metrics.enabled = self.config[CONF_KEY_INSTRUMENTATION]
 
         if CONF_KEY_BLOCKLIST not in self.config:
             self.config[CONF_KEY_BLOCKLIST] = []
@@ -71,319 +162,944 @@ class Core(CorePluginBase):
         if CONF_KEY_SESSION_STATUS not in self.config:
             self.config[CONF_KEY_SESSION_STATUS] = {}
 
-        self.blocklist = set(self.config[CONF_KEY_BLOCKLIST])
+        self.blocklist = Blocklist()
+        self.blocklist_store = BlocklistStore(deluge.configmanager.get_config_dir(BLOCKLIST_FILENAME))
+        if self.blocklist_store.exists:
+            self.blocklist_store.load(self.blocklist)
+        else:
+            self._migrate_blocklist()
+        # 移除停用期间已过期的条目
+        self._expire_blocklist()
         self.history_status = PersistenceStatus(**self.config[CONF_KEY_HISTORY_STATUS])
         session_status = self.config[CONF_KEY_SESSION_STATUS]
 
         if len(session_status) > 0:
             # 异常中断后恢复数据
-            self.history_status = self.history_status + session_status
+            self.history_status = self.history_status + PersistenceStatus(**session_status)
             self.config[CONF_KEY_HISTORY_STATUS] = self.history_status.persistence_dist()
             self.config[CONF_KEY_SESSION_STATUS] = {}
             self.config.save()
 
+        self.checkpoint = Checkpoint(deluge.configmanager.get_config_dir(CHECKPOINT_FILENAME))
+        self._recover_checkpoint()
+        # 本次启用的检查点 ID
+        self.checkpoint_id = uuid.uuid4().hex
+        self.checkpoint_loop = None
+        self._start_checkpoint_loop()
+
         # 恢复 blocklist
-        ip_filter = self.session.get_ip_filter()
-        for ip in self.blocklist:
-            ip_filter.add_rule(ip, ip, 1)
-        self.session.set_ip_filter(ip_filter)
+        self.ip_filter = IpFilterApplier(self.session, self.blocklist, metrics=self.metrics)
+        self.ip_filter.flush()
+        # 封禁过期定时器
+        self.expiry_call = None
+        self._schedule_expiry()
+
+        # 节点采样
+        self.peer_history = None
+        self._configure_peer_history()
+
+        # 后台快照采集
+        self.snapshot_worker = SnapshotWorker(self._collect_snapshot, self._apply_snapshot)
+        self.snapshot_worker.start(self.config[CONF_KEY_SNAPSHOT_INTERVAL])
+        # 增量查询最后一次写入的快照序号
+        self.snapshot_sequence = None
+
+        # 由节点事件维护的已连接节点登记表
+        self.peer_registry = PeerRegistry()
+        self.peer_registry.disconnect_listeners.append(self._on_peer_disconnected)
+        self._subscribe_peer_alerts()
+        event_manager.register_event_handler("TorrentRemovedEvent", self._on_torrent_removed)
+
+        # 会话统计采集
+        self.session_sampler = SessionSampler(self.session, self._metric_reader(), LT_RATE_NAMES)
+        self.session_sampler.listeners.append(self._on_session_sample)
+        # 会话统计时间序列
+        self.stats_store = TimeSeriesStore(
+            deluge.configmanager.get_config_dir(STATS_FILENAME), LT_STATUS_NAMES, GAUGE_COUNTERS.values()
+        )
+        component.get("AlertManager").register_handler(
+            "session_stats_alert", self.session_sampler.on_session_stats
+        )
+        self.session_sampler.start(self.config[CONF_KEY_SESSION_STATS_INTERVAL])
 
     def disable(self):
-        self.config[CONF_KEY_BLOCKLIST] = list(self.blocklist)
-
-        session_status = PersistenceStatus(**self.session_status.persistence_dist())
-        self.history_status = self.history_status + session_status
+        event_manager = component.get("EventManager")
+        for event, handler in self.acquirer.handlers().items():
+            event_manager.deregister_event_handler(event, handler)
+        event_manager.deregister_event_handler("TorrentRemovedEvent", self._on_torrent_removed)
+        self.session_sampler.stop()
+        component.get("AlertManager").deregister_handler(self.session_sampler.on_session_stats)
+        self.stats_store.close()
+        self._unsubscribe_peer_alerts()
+        self.snapshot_worker.stop()
+        if self.expiry_call is not None and self.expiry_call.active():
+            self.expiry_call.cancel()
+        # 封禁列表已持久化，停用后 libtorrent 只保留启用前已有的过滤规则
+        self.ip_filter.restore()
+
+        self.blocklist_store.compact(self.blocklist)
+        self.blocklist_store.close()
+
+        if self.checkpoint_loop is not None and self.checkpoint_loop.running:
+            self.checkpoint_loop.stop()
+        self.history_status = self.history_status + self._session_delta()
         self.config[CONF_KEY_HISTORY_STATUS] = self.history_status.persistence_dist()
         self.config[CONF_KEY_SESSION_STATUS] = {} # 清空
+        # 与历史状态一同保存，保存后中断也不会再次合并检查点
+        self.config[CONF_KEY_MERGED_CHECKPOINT] = self.checkpoint_id
 
         self.config.save()
+        self.checkpoint.remove()
 
     def update(self):
         pass
 
+    def _subscribe_peer_alerts(self):
+        alertmanager = component.get("AlertManager")
+        # 保存原有的 alert 类别，停用时恢复
+        self.alert_mask = self.session.get_settings()["alert_mask"]
+        self.session.apply_settings({"alert_mask": self.alert_mask | PEER_ALERT_CATEGORIES})
+        for alert_type, handler in self.peer_registry.handlers().items():
+            alertmanager.register_handler(alert_type, handler)
+
+        # 登记订阅之前已建立的连接
+        for source in self.acquirer.all_sources():
+            handle = source.status.handle
+            if not handle.is_valid():
+                continue
+            self.peer_registry.seed(source.torrent_id, [
+                lt_peer.ip for lt_peer in handle.get_peer_info()
+                if not lt_peer.flags & (lt_peer.connecting | lt_peer.handshake)
+            ])
+
+    def _unsubscribe_peer_alerts(self):
+        alertmanager = component.get("AlertManager")
+        for handler in self.peer_registry.handlers().values():
+            alertmanager.deregister_handler(handler)
+        self.session.apply_settings({"alert_mask": self.alert_mask})
+
+    def _migrate_blocklist(self):
+        """将旧版本保存在配置中的封禁列表迁移到独立的二进制文件"""
+        self.blocklist.replace(self.config[CONF_KEY_BLOCKLIST])
+        self.blocklist.restore_expires(self.config.get(CONF_KEY_BLOCKLIST_EXPIRES, {}))
+        self.blocklist_store.compact(self.blocklist)
+        if len(self.config[CONF_KEY_BLOCKLIST]) > 0:
+            log.info("PeerBanHelperAdapter: 已迁移 %d 个封禁条目", len(self.blocklist))
+            self.config[CONF_KEY_BLOCKLIST] = []
+            self.config[CONF_KEY_BLOCKLIST_EXPIRES] = {}
+            self.config.save()
+
     @export
+    @timed
     def set_config(self, config):
         """Sets the config dictionary"""
         for key in config:
             self.config[key] = config[key]
         self.config.save()
 
+        self.metrics.enabled = self.config[CONF_KEY_INSTRUMENTATION]
+        self.snapshot_worker.start(self.config[CONF_KEY_SNAPSHOT_INTERVAL])
+        self.session_sampler.reader = self._metric_reader()
+        self.session_sampler.start(self.config[CONF_KEY_SESSION_STATS_INTERVAL])
+        self._configure_peer_history()
+        self._start_checkpoint_loop()
+
+    def _configure_peer_history(self):
+        samples = self.config[CONF_KEY_PEER_HISTORY_SAMPLES]
+        if samples < 2:
+            self.peer_history = None
+        elif self.peer_history is None or self.peer_history.samples != samples:
+            self.peer_history = PeerHistory(samples)
+
+    def _recover_checkpoint(self):
+        """合并异常中断前写入的检查点"""
+        data = self.checkpoint.read()
+        if data is None:
+            return
+        if data.get("id") != self.config[CONF_KEY_MERGED_CHECKPOINT]:
+            self.history_status = self.history_status + PersistenceStatus(**data["status"])
+            self.config[CONF_KEY_HISTORY_STATUS] = self.history_status.persistence_dist()
+            self.config[CONF_KEY_MERGED_CHECKPOINT] = data.get("id", "")
+            self.config.save()
+            log.info("PeerBanHelperAdapter: 已从检查点恢复会话统计")
+        self.checkpoint.remove()
+
+    def _start_checkpoint_loop(self):
+        if self.checkpoint_loop is not None and self.checkpoint_loop.running:
+            self.checkpoint_loop.stop()
+        self.checkpoint_loop = None
+        interval = self.config[CONF_KEY_CHECKPOINT_INTERVAL]
+        if interval > 0:
+            self.checkpoint_loop = LoopingCall(self._write_checkpoint)
+            self.checkpoint_loop.start(interval, now=False)
+
+    def _write_checkpoint(self):
+        """写入本次启用以来尚未合并到历史状态的统计增量"""
+        if self.session_baseline is None:
+            return
+        try:
+            self.checkpoint.write({
+                "id": self.checkpoint_id,
+                "timestamp": time.time(),
+                "status": self._session_delta().persistence_dist(),
+            })
+        except OSError as ex:
+            log.error("PeerBanHelperAdapter: 写入检查点失败: %s", ex)
+
+    def _session_delta(self):
+        """本次启用以来的统计增量"""
+        delta = PersistenceStatus(**self.session_status.persistence_dist())
+        if self.session_baseline is not None:
+            delta = delta - self.session_baseline
+        return delta
+
+    def _metric_reader(self):
+        return MetricReader(LT_STATUS_NAMES + list(self.config[CONF_KEY_EXTRA_METRICS]))
+
+    def _on_session_sample(self, sample):
+        self.session_status.update_from_sample(sample.timestamp, sample.values, self.session_sampler.rates)
+        if self.session_baseline is None:
+            # 插件在 Deluge 运行期间重新启用时，此前的流量已合并到历史状态
+            self.session_baseline = PersistenceStatus(**self.session_status.persistence_dist())
+        self.stats_store.add(sample.timestamp, sample.values)
+
+    def _on_torrent_removed(self, torrent_id):
+        self.peer_registry.remove_torrent(torrent_id)
+        self.peer_index.remove_torrent(torrent_id)
+
+    def _on_peer_disconnected(self, key):
+        if self.peer_history is not None:
+            self.peer_history.evict(key)
+
     @export
+    @timed
     def get_config(self):
         """Returns the config dictionary"""
         status = {}
-        status[CONF_KEY_BLOCKLIST] = self.blocklist
+        status[CONF_KEY_BLOCKLIST] = list(self.blocklist)
         return status
 
     @export
-    def get_active_torrents_info(self):
-        """返回活跃种子的列表"""
+    @timed
+    def get_active_torrents_info(
+        self, peer_format=PEER_FORMAT_DICT, peer_fields=None, torrent_fields=None, peer_filter=None
+    ):
+        """返回活跃种子的列表
 
-        # 获取活跃的种子列表
-        filter_dict = {}
-        filter_dict["state"] = ["Active"]
-        torrent_ids = self.filtermanager.filter_torrent_ids(filter_dict)
+        Args:
+            peer_format (str): 节点列表格式，dict（默认）、rows 或 columns
+            peer_fields (list[str]): 需要的节点字段，为空时返回全部字段
+            torrent_fields (list[str]): 需要的种子字段，为空时返回全部字段
+            peer_filter (dict): 节点过滤条件，不满足的节点不会被构建与返回，参见 parse_peer_filter
+
+        Returns:
+            dict 格式返回种子列表；
+            rows/columns 格式返回 {"peer_format", "peer_fields", "torrents"}，
+            每个种子的 peers 按协商后的 peer_fields 顺序编码
+        """
+        if peer_format not in PEER_FORMATS:
+            raise ValueError("不支持的节点格式: %s" % peer_format)
+
+        peer_fields = resolve_peer_fields(peer_fields)
+        torrent_fields = resolve_torrent_fields(torrent_fields)
+        peer_filter = parse_peer_filter(peer_filter, self.blocklist)
+        torrents = self._build_active_torrents(peer_format, peer_fields, torrent_fields, peer_filter)
+        if peer_format == PEER_FORMAT_DICT:
+            return torrents
+        return {
+            "peer_format": peer_format,
+            "peer_fields": list(peer_fields),
+            "torrents": torrents,
+        }
 
-        active_torrents = []
+    @export
+    @timed
+    def get_active_torrents_snapshot(
+        self, peer_format=PEER_FORMAT_DICT, peer_fields=None, torrent_fields=None, peer_filter=None
+    ):
+        """返回后台采集的最近一次活跃种子快照
 
-        for torrent_id in torrent_ids:
-            torrent = ActiveTorrent()
-            deluge_torrent = self.torrentmanager[torrent_id]
-            torrent.id = torrent_id
-            torrent.name = deluge_torrent.get_name()
-            torrent.info_hash = torrent_id
-            torrent.progress = deluge_torrent.get_progress()
-            torrent.upload_payload_rate = deluge_torrent.status.upload_payload_rate
-            torrent.download_payload_rate = deluge_torrent.status.download_payload_rate
-
-            # LT torrent_info
-            torrent_info = deluge_torrent.handle.torrent_file()
-            torrent.size = torrent_info.total_size()
-            torrent.priv = torrent_info.priv()
-            piece_length = torrent_info.piece_length()
-
-            # LT torrent_status
-            torrent_status = deluge_torrent.handle.status()
-            torrent.completed_size = torrent_status.num_pieces * piece_length
-
-            # LT peer_info
-            lt_peers = deluge_torrent.handle.get_peer_info()
-            peers = []
-            for lt_peer in lt_peers:
-                log.debug("peer_id: %s", str(lt_peer.pid))
-                # 必须排除半连接状态节点，否则可能进入等待阻塞
-                if lt_peer.flags & lt_peer.connecting or lt_peer.flags & lt_peer.handshake:
-                    continue
-                try:
-                    client_name = decode_bytes(lt_peer.client)
-                except UnicodeDecodeError:
-                    client_name = "unknown"
-
-                peer = Peer(
-                    ip=lt_peer.ip[0],
-                    port=lt_peer.ip[1],
-                    peer_id=str(lt_peer.pid),
-                    client_name=client_name,
-                    up_speed=lt_peer.up_speed,
-                    down_speed=lt_peer.down_speed,
-                    payload_up_speed=lt_peer.payload_up_speed,
-                    payload_down_speed=lt_peer.payload_down_speed,
-                    total_upload=lt_peer.total_upload,
-                    total_download=lt_peer.total_download,
-                    progress=lt_peer.progress,
-                    flags=lt_peer.flags,
-                    source=lt_peer.source,
-                    local_endpoint_ip=lt_peer.local_endpoint[0],
-                    local_endpoint_port=lt_peer.local_endpoint[1],
-                    queue_bytes=lt_peer.queue_bytes,
-                    request_timeout=lt_peer.request_timeout,
-                    num_hashfails=lt_peer.num_hashfails,
-                    download_queue_length=lt_peer.download_queue_length,
-                    upload_queue_length=lt_peer.upload_queue_length,
-                    failcount=lt_peer.failcount,
-                    downloading_block_index=lt_peer.downloading_block_index,
-                    downloading_progress=lt_peer.downloading_progress,
-                    downloading_total=lt_peer.downloading_total,
-                    connection_type=lt_peer.connection_type,
-                    send_quota=lt_peer.send_quota,
-                    receive_quota=lt_peer.receive_quota,
-                    rtt=lt_peer.rtt,
-                    num_pieces=lt_peer.num_pieces,
-                    download_rate_peak=lt_peer.download_rate_peak,
-                    upload_rate_peak=lt_peer.upload_rate_peak,
-                    progress_ppm=lt_peer.progress_ppm,
-                )
-
-                peers.append(peer)
-
-            torrent.peers = peers
-            active_torrents.append(torrent.dist())
+        未启用后台采集（snapshot_interval 为 0）时同步采集，age 为 0。
+        参数与 get_active_torrents_info 相同。
 
-        return active_torrents
+        Returns:
+            {"age", "peer_format", "peer_fields", "torrents"}，age 为快照距今的秒数
+        """
+        if peer_format not in PEER_FORMATS:
+            raise ValueError("不支持的节点格式: %s" % peer_format)
+
+        peer_fields = resolve_peer_fields(peer_fields)
+        torrent_fields = resolve_torrent_fields(torrent_fields)
+        peer_filter = parse_peer_filter(peer_filter, self.blocklist)
+        snapshot = self.snapshot_worker.latest()
+        if snapshot is None:
+            age = 0.0
+            collected = self._collect_active_torrents(torrent_fields, peer_fields, peer_filter)
+        else:
+            age = snapshot.age
+            collected = snapshot.project(torrent_fields, peer_fields, peer_filter)
+        return {
+            "age": age,
+            "peer_format": peer_format,
+            "peer_fields": list(peer_fields),
+            "torrents": self._encode_active_torrents(collected, peer_format, peer_fields),
+        }
 
     @export
-    def get_torrents_info(self):
-        """返回所有种子的列表"""
-        torrent_ids = self.filtermanager.filter_torrent_ids(filter_dict={})
+    @timed
+    def get_active_torrents_page(
+        self,
+        page_size=DEFAULT_PAGE_SIZE,
+        continuation=None,
+        peer_format=PEER_FORMAT_DICT,
+        peer_fields=None,
+        torrent_fields=None,
+        peer_filter=None,
+    ):
+        """分页返回活跃种子的列表
+
+        首页（continuation 为空）时固定活跃种子集合，之后每页只构建本页种子的节点。
+        后续页沿用首页协商的格式、字段与过滤条件，忽略本次传入的 peer_format、peer_fields、torrent_fields、peer_filter。
 
-        torrents = []
+        Args:
+            page_size (int): 每页节点数上限，每页至少包含一个种子
+            continuation (str): 上一页返回的令牌
+            peer_format (str): 节点列表格式，dict（默认）、rows 或 columns
+            peer_fields (list[str]): 需要的节点字段，为空时返回全部字段
+            torrent_fields (list[str]): 需要的种子字段，为空时返回全部字段
+            peer_filter (dict): 节点过滤条件，参见 parse_peer_filter
+
+        Returns:
+            {"peer_format", "peer_fields", "torrents", "continuation"}，
+            continuation 为 None 表示没有更多数据
+        """
+        if continuation:
+            peer_format, peer_fields = self.paginator.context(continuation)
+        else:
+            if peer_format not in PEER_FORMATS:
+                raise ValueError("不支持的节点格式: %s" % peer_format)
+            peer_fields = resolve_peer_fields(peer_fields)
+            torrent_fields = resolve_torrent_fields(torrent_fields)
+            peer_filter = parse_peer_filter(peer_filter, self.blocklist)
+
+            snapshot = self.snapshot_worker.latest()
+            if snapshot is None:
+                iterator = self._iter_sweep(self.acquirer.active_sources(), torrent_fields, peer_fields, peer_filter)
+            else:
+                iterator = snapshot.iter_project(torrent_fields, peer_fields, peer_filter)
+            continuation = self.paginator.open(iterator, (peer_format, peer_fields))
+
+        page, continuation = self.paginator.take(continuation, max(int(page_size), 1))
+        return {
+            "peer_format": peer_format,
+            "peer_fields": list(peer_fields),
+            "torrents": self._encode_active_torrents(page, peer_format, peer_fields),
+            "continuation": continuation,
+        }
+
+    @export
+    @timed
+    def get_torrents_peers(
+        self, info_hashes, peer_format=PEER_FORMAT_DICT, peer_fields=None, torrent_fields=None, peer_filter=None
+    ):
+        """返回指定种子（无论是否活跃）的节点
+
+        只采集所选种子，开销只与所选种子的节点数相关，适合对少量重点种子高频轮询。
+        总是同步采集，不使用后台快照。
+
+        Args:
+            info_hashes (list[str]): 种子的 info hash，不存在的种子被忽略
+            peer_format (str): 节点列表格式，dict（默认）、rows 或 columns
+            peer_fields (list[str]): 需要的节点字段，为空时返回全部字段
+            torrent_fields (list[str]): 需要的种子字段，为空时返回全部字段
+            peer_filter (dict): 节点过滤条件，参见 parse_peer_filter
+
+        Returns:
+            与 get_active_torrents_info 相同
+        """
+        if peer_format not in PEER_FORMATS:
+            raise ValueError("不支持的节点格式: %s" % peer_format)
+
+        peer_fields = resolve_peer_fields(peer_fields)
+        torrent_fields = resolve_torrent_fields(torrent_fields)
+        peer_filter = parse_peer_filter(peer_filter, self.blocklist)
+        with self.metrics.time("collect.acquire_selected"):
+            sources = self.acquirer.selected_sources(info_hashes)
+        observations = []
+        collected = list(self._iter_collect(sources, torrent_fields, peer_fields, peer_filter, observations))
+        for torrent_id, lt_peers, now in observations:
+            self._observe_peers(torrent_id, lt_peers, now)
+        # 只采集了所选种子，不能据此移除其他种子的索引
+        self._prune_peer_history()
+        torrents = self._encode_active_torrents(collected, peer_format, peer_fields)
+        if peer_format == PEER_FORMAT_DICT:
+            return torrents
+        return {
+            "peer_format": peer_format,
+            "peer_fields": list(peer_fields),
+            "torrents": torrents,
+        }
+
+    @export
+    @timed
+    def get_peer_fields(self):
+        """返回支持的全部节点字段，供调用方协商 peer_fields"""
+        return list(PEER_FIELDS)
+
+    @export
+    @timed
+    def get_decode_cache_stats(self):
+        """返回节点 ID 与客户端名称解码缓存的命中统计"""
+        return decode_cache_info()
+
+    @export
+    @timed
+    def get_peer_changes(self, cursor=None):
+        """返回自游标以来连接、断开、被封禁与被拦截的节点
+
+        由节点事件维护，开销只与期间的连接变化数量相关，与已连接节点总数无关。
+        游标为空、无效或已过期时返回全部已连接节点（full 为 True）。
+
+        Args:
+            cursor (str): 上一次调用返回的游标
+        """
+        return self.peer_registry.changes(cursor)
+
+    @export
+    @timed
+    def get_peer_history(self, torrent_ids=None):
+        """返回节点在最近若干次采样内的平滑速率与进度变化
+
+        采样在每次采集节点时记录（包括后台快照采集），节点断开后移除。
+
+        Args:
+            torrent_ids (list[str]): 需要的种子 ID，为空时返回全部种子
+
+        Returns:
+            torrent_id -> [{"ip", "port", "samples", "window", "upload_rate", "download_rate",
+            "progress", "progress_delta"}]，未启用节点采样时返回空字典
+        """
+        if self.peer_history is None:
+            return {}
+        return self.peer_history.query(torrent_ids)
+
+    @export
+    @timed
+    def get_active_torrents_delta(self, token=None):
+        """返回自令牌以来活跃种子及其节点的增量变更
+
+        令牌为空、无效或已过期时返回全量数据（full 为 True），客户端需丢弃本地状态。
+
+        Args:
+            token (str): 上一次调用返回的令牌
+        """
+        snapshot = self.snapshot_worker.latest()
+        if snapshot is None:
+            self.snapshot_cache.update(self._build_active_torrents())
+        elif snapshot.sequence != self.snapshot_sequence:
+            # 后台快照未更新时无需推进代数
+            self.snapshot_sequence = snapshot.sequence
+            self.snapshot_cache.update(self._encode_active_torrents(snapshot.torrents))
+        return self.snapshot_cache.delta(token)
+
+    def _build_active_torrents(
+        self,
+        peer_format=PEER_FORMAT_DICT,
+        peer_fields=PEER_FIELDS,
+        torrent_fields=ACTIVE_TORRENT_FIELDS,
+        peer_filter=None,
+    ):
+        snapshot = self.snapshot_worker.latest()
+        if snapshot is None:
+            collected = self._collect_active_torrents(torrent_fields, peer_fields, peer_filter)
+        else:
+            collected = snapshot.project(torrent_fields, peer_fields, peer_filter)
+        return self._encode_active_torrents(collected, peer_format, peer_fields)
+
+    def _encode_active_torrents(self, collected, peer_format=PEER_FORMAT_DICT, peer_fields=PEER_FIELDS):
+        start = time.perf_counter()
+        active_torrents = []
+        peers = 0
+        for torrent, rows in collected:
+            torrent = dict(torrent)
+            torrent["peers"] = encode_peers(rows, peer_fields, peer_format)
+            active_torrents.append(torrent)
+            peers += len(rows)
+
+        metrics = self.metrics
+        if metrics.enabled:
+            metrics.observe("encode", time.perf_counter() - start)
+            metrics.observe_size("encode.torrents", len(active_torrents))
+            metrics.observe_size("encode.peers", peers)
+        return active_torrents
+
+    def _collect_active_torrents(
+        self,
+        torrent_fields=ACTIVE_TORRENT_FIELDS,
+        peer_fields=PEER_FIELDS,
+        peer_filter=None,
+        observations=None,
+        metrics=None,
+    ):
+        """采集活跃种子及其节点，返回 [(种子字典, 节点元组列表)]
+
+        Args:
+            observations (list): 不为空时不更新节点索引与节点采样，而是将观测结果追加到其中（参见 _iter_collect），
+                由调用方在 reactor 线程中交给 _apply_observations
+            metrics (AdapterMetrics): 记录采集耗时与计数的实例，为空时使用 self.metrics
+        """
+        if metrics is None:
+            metrics = self.metrics
+        # 获取活跃的种子列表
+        with metrics.time("collect.acquire"):
+            sources = self.acquirer.active_sources()
+        if observations is None:
+            pending = []
+            collected = list(self._iter_collect(sources, torrent_fields, peer_fields, peer_filter, pending, metrics))
+            self._apply_observations(pending)
+        else:
+            collected = list(
+                self._iter_collect(sources, torrent_fields, peer_fields, peer_filter, observations, metrics)
+            )
+        return collected
+
+    def _collect_snapshot(self):
+        """后台快照采集，在线程池中执行（参见 SnapshotWorker）
+
+        只读取 libtorrent，节点观测与采集耗时记录在本次采集独立的对象中，由 _apply_snapshot 在 reactor 线程中应用。
+        """
+        observations = []
+        metrics = AdapterMetrics(self.metrics.enabled)
+        return self._collect_active_torrents(observations=observations, metrics=metrics), (observations, metrics)
+
+    def _apply_snapshot(self, updates):
+        """应用后台快照采集的节点观测与采集耗时，在 reactor 线程中调用"""
+        observations, metrics = updates
+        self.metrics.merge(metrics)
+        self._apply_observations(observations)
+
+    def _apply_observations(self, observations):
+        """以一次完整采集的结果更新节点索引与节点采样，必须在 reactor 线程中调用"""
+        with self.metrics.time("collect.index"):
+            for torrent_id, lt_peers, now in observations:
+                self._observe_peers(torrent_id, lt_peers, now)
+            self._finish_sweep(torrent_id for torrent_id, _, _ in observations)
+
+    def _iter_sweep(self, sources, torrent_fields, peer_fields, peer_filter=None):
+        """分页采集全部活跃种子，每个种子采集后更新节点索引与节点采样，遍历结束时与 _apply_observations 一样清理"""
+        observations = []
+        torrent_ids = []
+        for item in self._iter_collect(sources, torrent_fields, peer_fields, peer_filter, observations):
+            for torrent_id, lt_peers, now in observations:
+                self._observe_peers(torrent_id, lt_peers, now)
+                torrent_ids.append(torrent_id)
+            del observations[:]
+            yield item
+        self._finish_sweep(torrent_ids)
+
+    def _finish_sweep(self, torrent_ids):
+        """一次完整采集结束后移除不再活跃种子的节点索引，并释放长时间未被采样的节点"""
+        # 不再活跃的种子不会被再次采集，移除其索引
+        self.peer_index.retain(torrent_ids)
+        self._prune_peer_history()
+
+    def _prune_peer_history(self):
+        if self.peer_history is not None:
+            self.peer_history.prune(time.time())
+
+    def _observe_peers(self, torrent_id, lt_peers, now):
+        # 与 _build_peer_rows 一致，只索引已建立的连接
+        self.peer_index.update(torrent_id, [
+            lt_peer.ip[0] for lt_peer in lt_peers
+            if not lt_peer.flags & (lt_peer.connecting | lt_peer.handshake)
+        ])
+        peer_history = self.peer_history
+        if peer_history is not None:
+            peer_history.record_peers(torrent_id, lt_peers, now)
+
+    def _iter_collect(self, sources, torrent_fields, peer_fields, peer_filter, observations, metrics=None):
+        """逐个种子惰性采集，产生 (种子字典, 节点元组列表)
+
+        不更新节点索引与节点采样，只将 (torrent_id, lt_peers, 时间戳) 在产生该种子之前追加到 observations 中。
+
+        Args:
+            metrics (AdapterMetrics): 参见 _collect_active_torrents
+        """
+        torrent_getters = [(name, TORRENT_GETTERS[name]) for name in torrent_fields]
+        build_row = peer_row_builder(peer_fields)
+        accept = peer_filter.peer_info_predicate() if peer_filter is not None else None
+        # 各阶段的累计耗时与处理数量，采集结束（或分页中止）时一次性记录
+        peer_info_time = build_time = 0.0
+        torrents = peers = rows_built = 0
+
+        try:
+            for source in sources:
+                handle = source.status.handle
+                if not handle.is_valid():
+                    # 分页采集期间种子已被移除
+                    continue
+                start = time.perf_counter()
+                torrent = {name: getter(source) for name, getter in torrent_getters}
+
+                # LT peer_info
+                lt_peers = handle.get_peer_info()
+                peer_info_done = time.perf_counter()
+                # 分页采集的生成器会跨越多次调用，时间戳必须与本次读取的节点数据对应
+                observations.append((source.torrent_id, lt_peers, time.time()))
+                rows = self._build_peer_rows(lt_peers, build_row, accept)
+                build_time += time.perf_counter() - peer_info_done
+                peer_info_time += peer_info_done - start
+                torrents += 1
+                peers += len(lt_peers)
+                rows_built += len(rows)
+                yield torrent, rows
+        finally:
+            if metrics is None:
+                metrics = self.metrics
+            if metrics.enabled and torrents:
+                metrics.observe("collect.get_peer_info", peer_info_time)
+                metrics.observe("collect.build_rows", build_time)
+                metrics.count("collect.torrents", torrents)
+                metrics.count("collect.peers", peers)
+                metrics.count("collect.rows", rows_built)
+
+    @staticmethod
+    def _build_peer_rows(lt_peers, build_row, accept=None):
+        rows = []
+        for lt_peer in lt_peers:
+            # 必须排除半连接状态节点，否则可能进入等待阻塞
+            if lt_peer.flags & lt_peer.connecting or lt_peer.flags & lt_peer.handshake:
+                continue
+            if accept is not None and not accept(lt_peer):
+                continue
+            rows.append(build_row(lt_peer))
+        return rows
 
-        for torrent_id in torrent_ids:
-            torrent = Torrent()
-            deluge_torrent = self.torrentmanager[torrent_id]
-            torrent.id = torrent_id
-            torrent.name = deluge_torrent.get_name()
-            torrent.info_hash = torrent_id
-            torrent.progress = deluge_torrent.get_progress()
+    @export
+    @timed
+    def get_torrents_info(self, torrent_fields=None):
+        """返回所有种子的列表
+
+        名称、大小等元数据来自缓存，只有 progress 与 completed_size 由本次批量获取的状态计算。
 
-            # LT torrent_info
-            torrent_info = deluge_torrent.handle.torrent_file()
-            torrent.size = torrent_info.total_size()
-            torrent.priv = torrent_info.priv()
-            piece_length = torrent_info.piece_length()
+        Args:
+            torrent_fields (list[str]): 需要的种子字段，为空时返回全部字段
+        """
+        torrent_fields = resolve_torrent_fields(torrent_fields, TORRENT_FIELDS)
+        torrent_getters = [(name, TORRENT_GETTERS[name]) for name in torrent_fields]
 
-            # LT torrent_status
-            torrent_status = deluge_torrent.handle.status()
-            torrent.completed_size = torrent_status.num_pieces * piece_length
+        torrents = []
 
-            torrents.append(torrent.dist())
+        with self.metrics.time("get_torrents_info.acquire"):
+            sources = self.acquirer.all_sources()
+        for source in sources:
+            torrents.append({name: getter(source) for name, getter in torrent_getters})
 
+        self.metrics.observe_size("get_torrents_info.torrents", len(torrents))
         return torrents
 
     @export
-    def get_blocklist(self):
-        """目前被封禁的所有 IP 列表"""
+    @timed
+    def get_blocklist(self, since=None):
+        """目前被封禁的条目列表
+
+        每次产生效果的变更使版本号加一，digest 为封禁列表内容的摘要，可用于校验本地副本。
+        传入上一次返回的 cursor 时只返回此后的变更；cursor 为空、无效或已过期时返回全部条目（full 为 True）。
+
+        Args:
+            since (str): 上一次调用返回的 cursor
+
+        Returns:
+            {"version", "digest", "cursor", "size", "full", "unchanged", ...}；
+            全量时另有 "ips" 与 "expires"（带有过期时间的条目 -> 过期时间戳，整数秒）；
+            增量时另有 "added"、"removed" 与 "expires"（新增条目中带有过期时间的条目），过期时间变更的条目按新增返回
+        """
+        blocklist = self.blocklist
         result = {
-            "size": len(self.blocklist),
-            "ips": list(self.blocklist),
+            "version": blocklist.version,
+            "digest": blocklist.digest,
+            "cursor": blocklist.cursor,
+            "size": len(blocklist),
+            "full": False,
+            "unchanged": False,
         }
+        version = blocklist.parse_cursor(since)
+        changes = blocklist.changes(version) if version is not None else None
+        if changes is None:
+            result["full"] = True
+            result["ips"] = list(blocklist)
+            result["expires"] = dict(blocklist.expires)
+            self.metrics.observe_size("get_blocklist.ips", result["size"])
+            return result
+
+        added, removed = changes
+        if not added and not removed:
+            result["unchanged"] = True
+            return result
+        expires = blocklist.expires
+        result["added"] = added
+        result["removed"] = removed
+        result["expires"] = {key: expires[key] for key in added if key in expires}
+        self.metrics.observe_size("get_blocklist.changes", len(added) + len(removed))
         return result
 
     @export
+    @timed
     def replace_blocklist(self, ips):
         """全量更新 IP 封禁列表
 
-        Args:
-            ips (list[str]): 需要封禁的所有 IP 列表
-        """
-        pend_ips = set(ips)
-        # 重新构建 IP 过滤器
-        ip_filter = lt.ip_filter()
-        for ip in pend_ips:
-            ip_filter.add_rule(ip, ip, 1)
+        只应用与当前封禁列表的差异，内容不变时不会写入文件或重新应用过滤器。
 
-        # 更新 LT
-        self.session.set_ip_filter(ip_filter)
+        Args:
+            ips (list[str]): 需要封禁的所有条目，支持单个 IP、CIDR（1.2.3.0/24）与范围（1.2.3.4-1.2.3.9）
 
-        self.blocklist.clear()
-        self.blocklist.update(pend_ips)
-        return {}
+        Returns:
+            {"added", "removed", "version", "digest"}，added 与 removed 为变更的条目数
+        """
+        with self.metrics.time("blocklist.update"):
+            added, removed = self.blocklist.replace(ips)
+        if added or removed:
+            # 只追加差异，被删除的条目以不拆分重叠条目的删除记录写入
+            with self.metrics.time("blocklist.store"):
+                self.blocklist_store.append_delete(self.blocklist.parse_entries(removed))
+                self.blocklist_store.append_add(self.blocklist.parse_entries(added))
+            self._compact_blocklist_store()
+            self.ip_filter.schedule()
+        return {
+            "added": len(added),
+            "removed": len(removed),
+            "version": self.blocklist.version,
+            "digest": self.blocklist.digest,
+        }
 
     @export
-    def ban_ips(self, ips):
+    @timed
+    def ban_ips(self, ips, ttl=None, disconnect=False):
         """增量封禁 IP
 
         Args:
-            ips (list[str]): 需要封禁的 IP 列表
-        """
-        # 待处理的 ip
-        pend_ips = set()
-        for ip in ips:
-            if ip not in self.blocklist:
-                pend_ips.add(ip)
+            ips (list[str] | dict[str, int]): 需要封禁的条目，支持单个 IP、CIDR 与范围；
+                为字典时值为该条目的封禁时长（秒），为空或不大于 0 表示永久封禁
+            ttl (int): ips 为列表时整批条目的封禁时长（秒），为空表示永久封禁
+            disconnect (bool): 是否立即断开已连接的被封禁节点
 
-        if len(pend_ips) == 0:
-            return {}
+        对已封禁的条目，以本次调用的封禁时长为准。
 
-        ip_filter = self.session.get_ip_filter()
-        for ip in pend_ips:
-            ip_filter.add_rule(ip, ip, 1)  # 1 阻止通过
+        Returns:
+            disconnect 为 True 时返回 {"disconnected": 估计断开的连接数}，按最近一次采集的节点估计
+        """
+        now = time.time()
+        if isinstance(ips, dict):
+            batches = {}
+            for entry, entry_ttl in ips.items():
+                batches.setdefault(entry_ttl, []).append(entry)
+        else:
+            batches = {ttl: ips}
+
+        added = []
+        banned = []
+        for batch_ttl, entries in batches.items():
+            # 以整数秒保存与返回，rencode 默认以 32 位浮点数编码 float，时间戳会有数十秒的误差
+            expires_at = int(math.ceil(now + batch_ttl)) if batch_ttl and batch_ttl > 0 else None
+            with self.metrics.time("blocklist.update"):
+                ranges = self.blocklist.parse_entries(entries)
+                added.extend(self.blocklist.add_ranges(ranges, expires_at))
+            banned.extend(format_entry(*parsed) for parsed in ranges)
+            with self.metrics.time("blocklist.store"):
+                self.blocklist_store.append_add(ranges, expires_at)
+        self._schedule_expiry()
+        self._compact_blocklist_store()
+        self.metrics.count("ban_ips.entries", len(banned))
+
+        if len(added) > 0:
+            self.ip_filter.schedule()
+
+        if disconnect:
+            return {"disconnected": self._disconnect_banned(banned)}
+        return {}
 
-        self.session.set_ip_filter(ip_filter)
+    def _disconnect_banned(self, entries):
+        """立即应用过滤器并清理已断开的节点，返回估计断开的连接数
 
-        self.blocklist.update(pend_ips)
-        return {}
+        libtorrent 在 set_ip_filter 时会断开所有种子中被过滤的已连接节点，
+        这里通过节点索引找出受影响的连接，只需处理被封禁的节点。
+        节点索引只反映最近一次采集，返回值是按该次采集估计的连接数，并非 libtorrent 实际关闭的连接数。
+        """
+        if self.ip_filter.pending:
+            self.ip_filter.flush()
+
+        with self.metrics.time("disconnect.match"):
+            matched = self.peer_index.match(self.blocklist, entries)
+        if not matched:
+            return 0
+
+        torrent_ids = set()
+        disconnected = 0
+        for ip, torrents in matched.items():
+            self.peer_index.discard(ip)
+            torrent_ids.update(torrents)
+            disconnected += len(torrents)
+        self.snapshot_worker.discard_peers(set(matched), torrent_ids)
+        self.metrics.count("disconnect.peers", disconnected)
+        log.debug("PeerBanHelperAdapter: 已断开 %d 个被封禁节点的连接", disconnected)
+        return disconnected
 
     @export
+    @timed
     def unban_ips(self, ips):
         """增量解禁 IP
 
+        与已封禁的 CIDR 或范围部分重叠时，只解禁重叠的部分。
+
         Args:
-            ips (list[str]): 需要解禁的 IP 列表
+            ips (list[str]): 需要解禁的条目，支持单个 IP、CIDR 与范围
         """
-        # 待处理的 ip
-        pend_ips = set()
-        for ip in ips:
-            if ip in self.blocklist:
-                pend_ips.add(ip)
-
-        if len(pend_ips) == 0:
+        with self.metrics.time("blocklist.update"):
+            ranges = self.blocklist.parse_entries(ips)
+            removed = self.blocklist.remove_ranges(ranges)
+        if len(removed) == 0:
             return {}
 
-        ip_filter = self.session.get_ip_filter()
-        for ip in pend_ips:
-            ip_filter.add_rule(ip, ip, 0)  # 0 允许通过，后置规则覆盖
-
-        self.session.set_ip_filter(ip_filter)
-
-        for ip in pend_ips:
-            if ip in self.blocklist:
-                self.blocklist.remove(ip)
+        with self.metrics.time("blocklist.store"):
+            self.blocklist_store.append_remove(ranges)
+        self._compact_blocklist_store()
+        self.ip_filter.schedule()
         return {}
 
+    def _compact_blocklist_store(self):
+        if self.blocklist_store.needs_compaction(len(self.blocklist)):
+            self.blocklist_store.compact(self.blocklist)
+
+    def _schedule_expiry(self):
+        """按最早的过期时间重新设置封禁过期定时器，到期时间向上取整到 EXPIRY_WINDOW"""
+        expires_at = self.blocklist.next_expiry()
+        if expires_at is not None:
+            expires_at = math.ceil(expires_at / EXPIRY_WINDOW) * EXPIRY_WINDOW
+        if self.expiry_call is not None and self.expiry_call.active():
+            if expires_at is not None and self.expiry_call.getTime() <= expires_at:
+                return
+            self.expiry_call.cancel()
+        self.expiry_call = None
+        if expires_at is not None:
+            self.expiry_call = reactor.callLater(max(expires_at - time.time(), 0), self._expire_bans)
+
+    def _expire_bans(self):
+        """批量移除已过期的封禁条目，只触发一次过滤器应用"""
+        self.expiry_call = None
+        expired = self._expire_blocklist()
+        if expired:
+            log.debug("PeerBanHelperAdapter: %d 个封禁条目已过期", len(expired))
+            self.ip_filter.schedule()
+        self._schedule_expiry()
+
+    def _expire_blocklist(self):
+        """移除已过期的封禁条目并写入日志，返回被移除的规范条目列表
+
+        过期以只删除完全一致条目的记录写入日志，重放时与运行期间的先后顺序一致，
+        不会在之后的解封记录之前重新加入已过期的条目。
+        """
+        expired = self.blocklist.expire(time.time())
+        if expired:
+            with self.metrics.time("blocklist.store"):
+                self.blocklist_store.append_delete(self.blocklist.parse_entries(expired))
+            self._compact_blocklist_store()
+        return expired
+
     @export
+    @timed
     def get_history_status(self):
         return self.history_status.dist()
 
     @export
-    def get_session_totals(self):
-        """获取会话统计信息"""
-
-        def update_status(lt_stats):
-            now_datetime = datetime.now()
-            stats_last_datetime = datetime.fromtimestamp(self.session_status.stats_last_timestamp)
-            # 计算时间间隔
-            interval = (now_datetime - stats_last_datetime).total_seconds()
-            if interval <= 0:
-                return
+    @timed
+    def get_session_history(self, resolution="minute", start=None, end=None, names=None):
+        """按时间粒度查询会话统计的历史记录
+
+        Args:
+            resolution (str): 时间粒度，minute、hour 或 day
+            start (int): 起始时间戳，为空时返回结束时间前的 60 个时间段
+            end (int): 结束时间戳，为空时为当前时间
+            names (list[str]): 需要的 libtorrent 计数器，为空时返回全部计数器
+
+        Returns:
+            {"resolution", "step", "names", "points"}，points 的元素为 [时间段起点, 各计数器的值]，
+            累计计数器为时间段内的增量，瞬时计数器为时间段内最后一次采样的值
+        """
+        if resolution not in RESOLUTIONS:
+            raise ValueError("不支持的时间粒度: %s" % resolution)
+        if end is None:
+            end = time.time()
+        if start is None:
+            start = end - RESOLUTIONS[resolution][0] * (DEFAULT_HISTORY_POINTS - 1)
+        return self.stats_store.query(resolution, start, end, names)
+
+    @export
+    @timed
+    def get_available_metrics(self):
+        """返回 libtorrent 支持的全部会话统计名称，可加入配置 extra_metrics 中采集"""
+        return sorted(available_metrics())
 
-            self.session_status.stats_last_timestamp = int(now_datetime.timestamp())
-
-            ip_overhead_download = lt_stats.get('net.recv_ip_overhead_bytes')
-            ip_overhead_upload = lt_stats['net.sent_ip_overhead_bytes']
-            total_download = lt_stats['net.recv_bytes'] + ip_overhead_download
-            total_upload = lt_stats['net.sent_bytes'] + ip_overhead_upload
-            total_payload_download = lt_stats['net.recv_payload_bytes']
-            total_payload_upload = lt_stats['net.sent_payload_bytes']
-            tracker_download = lt_stats['net.recv_tracker_bytes']
-            tracker_upload = lt_stats['net.sent_tracker_bytes']
-            dht_download = lt_stats['dht.dht_bytes_in']
-            dht_upload = lt_stats['dht.dht_bytes_out']
-
-            def calc_rate(previous, current) -> float:
-                assert current >= previous, "当前值应当大于或等于前一值"
-                assert interval > 0, "间隔应为正数"
-                return (current - previous) / interval
-
-            self.session_status.payload_download_rate = calc_rate(self.session_status.total_payload_download, total_payload_download)
-            self.session_status.payload_upload_rate = calc_rate(self.session_status.total_payload_upload, total_payload_upload)
-            self.session_status.download_rate = calc_rate(self.session_status.total_download, total_download)
-            self.session_status.upload_rate = calc_rate(self.session_status.total_upload, total_upload)
-            self.session_status.ip_overhead_download_rate = calc_rate(self.session_status.ip_overhead_download, ip_overhead_download)
-            self.session_status.ip_overhead_upload_rate = calc_rate(self.session_status.ip_overhead_upload, ip_overhead_upload)
-            self.session_status.dht_download_rate = calc_rate(self.session_status.dht_download, dht_download)
-            self.session_status.dht_upload_rate = calc_rate(self.session_status.dht_upload, dht_upload)
-            self.session_status.tracker_download_rate = calc_rate(self.session_status.tracker_download, tracker_download)
-            self.session_status.tracker_upload_rate = calc_rate(self.session_status.tracker_upload, tracker_upload)
-
-            self.session_status.total_payload_download = total_payload_download
-            self.session_status.total_payload_upload = total_payload_upload
-            self.session_status.total_download = total_download
-            self.session_status.total_upload = total_upload
-            self.session_status.ip_overhead_download = ip_overhead_download
-            self.session_status.ip_overhead_upload = ip_overhead_upload
-            self.session_status.tracker_download = tracker_download
-            self.session_status.tracker_upload = tracker_upload
-            self.session_status.dht_download = dht_download
-            self.session_status.dht_upload = dht_upload
-
-            # 被丢弃的重复下载字节数（从不同的对等节点下载） + 因哈希校验失败而丢弃的已下载字节数
-            self.session_status.total_wasted = lt_stats['net.recv_redundant_bytes'] + lt_stats['net.recv_failed_bytes']
-            self.session_status.dht_nodes = lt_stats['dht.dht_nodes']
-            self.session_status.disk_read_queue = lt_stats['peer.num_peers_up_disk']
-            self.session_status.disk_write_queue = lt_stats['peer.num_peers_down_disk']
-            self.session_status.peers_count = lt_stats["peer.num_peers_connected"]
-
-            # 30分钟写盘一次
-            if interval > 1800:
-                self.config[CONF_KEY_SESSION_STATUS] = self.session_status.persistence_dist()
-                self.config.save()
-
-        lt_status_call = client.core.get_session_status(LT_STATUS_NAMES)
-        lt_status_call.addCallback(update_status)
+    @export
+    @timed
+    def get_session_metrics(self, names=None):
+        """返回最近一次采样的会话统计原始值
+
+        Args:
+            names (list[str]): 需要的统计名称，为空时返回全部已采集的统计；
+                只能返回 LT_STATUS_NAMES 与配置 extra_metrics 中的统计
 
+        Returns:
+            {"timestamp", "values"}，尚未采样时 timestamp 为 None
+        """
+        sample = self.session_sampler.latest
+        if sample is None:
+            return {"timestamp": None, "values": {}}
+        values = sample.values
+        if names:
+            values = {name: values[name] for name in names if name in values}
+        return {"timestamp": sample.timestamp, "values": dict(values)}
+
+    @export
+    @timed
+    def get_session_totals(self):
+        """获取会话统计信息
+
+        速率由后台采集的相邻两次采样计算，smoothed_rates 为 EWMA 平滑后的速率。
+        """
         # 合并会话状态和历史状态
         status = SessionStatus(**self.session_status.dist())
+        if self.session_baseline is not None:
+            status = status - self.session_baseline
         status = status + self.history_status
 
-        return status.dist()
+        result = status.dist()
+        result["smoothed_rates"] = combine_rates(self.session_sampler.smoothed)
+        return result
+
+    @export
+    def get_adapter_metrics(self, output_format="json"):
+        """返回插件各阶段的耗时直方图、响应大小与计数器
+
+        耗时按导出方法（整体耗时）与内部阶段（collect.*、encode、ip_filter.*、blocklist.* 等）分别记录，
+        响应大小以条目数记录。配置 instrumentation 为 False 时停止记录。
+
+        Args:
+            output_format (str): json（默认）或 prometheus，后者返回 Prometheus 文本格式
+
+        Returns:
+            json 格式返回 {"enabled", "latency_seconds", "response_items", "counters", "gauges"}
+        """
+        gauges = {
+            "blocklist_entries": len(self.blocklist),
+            "blocklist_rules": self.blocklist.rule_count,
+            "ip_filter_applies": self.ip_filter.apply_count,
+            "indexed_peers": len(self.peer_index),
+            "connected_peers": len(self.peer_registry),
+        }
+        if output_format == "prometheus":
+            return self.metrics.prometheus(gauges)
+        if output_format != "json":
+            raise ValueError("不支持的输出格式: %s" % output_format)
+        result = self.metrics.dist()
+        result["gauges"] = gauges
+        return result
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2024 azicen <chenjiazi2000@outlook.com>
+#
+# This file is part of PeerBanHelperAdapter and is licensed under MIT license, or later,
+# with the additional special exception to link portions of this program with
+# the OpenSSL library. See LICENSE for more details.
+"""增量同步使用的 "纪元:版本" 游标
+
+纪元在每次实例化时生成，插件重载后以旧纪元生成的游标自动失效；
+版本为单调递增的序号，调用方凭游标只获取此后的变更。
+"""
+from __future__ import unicode_literals
+
+import uuid
+
+
+def new_epoch():
+    return uuid.uuid4().hex[:8]
+
+
+def format_cursor(epoch, version):
+    return "%s:%d" % (epoch, version)
+
+
+def parse_cursor(cursor, epoch, floor, latest):
+    """解析游标，返回其中的版本
+
+    Args:
+        floor (int): 仍可进行增量同步的最小版本
+        latest (int): 当前版本
+
+    Returns:
+        游标为空、格式无效、纪元不一致或版本不在 [floor, latest] 之内时返回 None
+    """
+    if not cursor:
+        return None
+    try:
+        cursor_epoch, version = cursor.split(":", 1)
+        version = int(version)
+    except (AttributeError, ValueError):
+        return None
+    if cursor_epoch != epoch or version < floor or version > latest:
+        return None
+    return version
+
+
+def entries_since(log, version):
+    """从最新的记录向前产生版本大于 version 的记录，开销只与期间的变更数量相关
+
+    Args:
+        log (deque): 按版本递增追加的记录，每条记录的第一个元素为版本
+    """
+    for entry in reversed(log):
+        if entry[0] <= version:
+            return
+        yield entry
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2024 azicen <chenjiazi2000@outlook.com>
+#
+# This file is part of PeerBanHelperAdapter and is licensed under MIT license, or later,
+# with the additional special exception to link portions of this program with
+# the OpenSSL library. See LICENSE for more details.
+from __future__ import unicode_literals
+
+import functools
+from bisect import bisect_left
+from contextlib import contextmanager
+from time import perf_counter
+
+# 耗时直方图的桶上界（秒），最后一个桶为 +Inf
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 响应大小直方图的桶上界（条目数）
+SIZE_BUCKETS = (0, 10, 100, 1000, 10000, 100000, 1000000)
+
+_PROMETHEUS_PREFIX = "pbh_adapter"
+
+
+class Histogram:
+    """固定桶的直方图，记录一次只需一次二分查找与两次加法"""
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        # 每个桶（不累计）的次数，最后一项为超过最大上界的次数
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other):
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.sum += other.sum
+        self.count += other.count
+
+    def dist(self) -> dict:
+        buckets = {}
+        cumulative = 0
+        for bound, count in zip(self.bounds + (float("inf"),), self.counts):
+            cumulative += count
+            buckets["+Inf" if bound == float("inf") else repr(bound)] = cumulative
+        return {"buckets": buckets, "sum": self.sum, "count": self.count}
+
+
+class AdapterMetrics:
+    """插件内部各阶段的耗时直方图与计数器
+
+    耗时按阶段名称记录，例如导出方法名称（整体耗时）或 collect.get_peer_info（采集中的某个阶段）；
+    响应大小按条目数（种子或节点数）记录，序列化后的字节数需要额外编码一次，不做统计；
+    计数器记录处理的种子与节点数量与调用失败次数。
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        # 阶段名称 -> 耗时 Histogram
+        self.histograms: dict[str, Histogram] = {}
+        # 响应名称 -> 条目数 Histogram
+        self.sizes: dict[str, Histogram] = {}
+        # 计数器名称 -> 值
+        self.counters: dict[str, int] = {}
+
+    def observe(self, phase, seconds):
+        histogram = self.histograms.get(phase)
+        if histogram is None:
+            histogram = self.histograms.setdefault(phase, Histogram())
+        histogram.observe(seconds)
+
+    def observe_size(self, name, items):
+        if not self.enabled:
+            return
+        histogram = self.sizes.get(name)
+        if histogram is None:
+            histogram = self.sizes.setdefault(name, Histogram(SIZE_BUCKETS))
+        histogram.observe(items)
+
+    def count(self, name, value=1):
+        if not self.enabled:
+            return
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def merge(self, other):
+        """合并另一实例记录的耗时、响应大小与计数器，例如后台采集在线程池中单独记录的结果"""
+        if not self.enabled:
+            return
+        for target, histograms in ((self.histograms, other.histograms), (self.sizes, other.sizes)):
+            for name, histogram in histograms.items():
+                target.setdefault(name, Histogram(histogram.bounds)).merge(histogram)
+        for name, value in other.counters.items():
+            self.count(name, value)
+
+    @contextmanager
+    def time(self, phase):
+        if not self.enabled:
+            yield
+            return
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(phase, perf_counter() - start)
+
+    def dist(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "latency_seconds": {phase: histogram.dist() for phase, histogram in sorted(self.histograms.items())},
+            "response_items": {name: histogram.dist() for name, histogram in sorted(self.sizes.items())},
+            "counters": dict(sorted(self.counters.items())),
+        }
+
+    def prometheus(self, gauges=None) -> str:
+        """按 Prometheus 文本格式输出
+
+        Args:
+            gauges (dict[str, float]): 额外输出的瞬时值
+        """
+        lines = []
+        _render_histograms(lines, "%s_phase_seconds" % _PROMETHEUS_PREFIX, "phase",
+                           "Adapter phase latency in seconds.", self.histograms)
+        _render_histograms(lines, "%s_response_items" % _PROMETHEUS_PREFIX, "response",
+                           "Adapter response size in entries.", self.sizes)
+
+        name = "%s_events_total" % _PROMETHEUS_PREFIX
+        lines.append("# HELP %s Adapter event counters." % name)
+        lines.append("# TYPE %s counter" % name)
+        for counter, value in sorted(self.counters.items()):
+            lines.append('%s{event="%s"} %d' % (name, counter, value))
+
+        for gauge, value in sorted((gauges or {}).items()):
+            name = "%s_%s" % (_PROMETHEUS_PREFIX, gauge)
+            lines.append("# TYPE %s gauge" % name)
+            lines.append("%s %r" % (name, value))
+        return "\n".join(lines) + "\n"
+
+
+def _render_histograms(lines, name, label, help_text, histograms):
+    lines.append("# HELP %s %s" % (name, help_text))
+    lines.append("# TYPE %s histogram" % name)
+    for key, histogram in sorted(histograms.items()):
+        data = histogram.dist()
+        for bound, cumulative in data["buckets"].items():
+            lines.append('%s_bucket{%s="%s",le="%s"} %d' % (name, label, key, bound, cumulative))
+        lines.append('%s_sum{%s="%s"} %r' % (name, label, key, data["sum"]))
+        lines.append('%s_count{%s="%s"} %d' % (name, label, key, data["count"]))
+
+
+def timed(func):
+    """记录导出方法的整体耗时与失败次数，使用实例的 metrics 属性"""
+    phase = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        metrics = self.metrics
+        if not metrics.enabled:
+            return func(self, *args, **kwargs)
+        start = perf_counter()
+        try:
+            return func(self, *args, **kwargs)
+        except Exception:
+            metrics.count(phase + ".errors")
+            raise
+        finally:
+            metrics.observe(phase, perf_counter() - start)
+
+    return wrapper
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2024 azicen <chenjiazi2000@outlook.com>
+#
+# This file is part of PeerBanHelperAdapter and is licensed under MIT license, or later,
+# with the additional special exception to link portions of this program with
+# the OpenSSL library. See LICENSE for more details.
+from __future__ import unicode_literals
+
+import logging
+from time import perf_counter
+
+from deluge._libtorrent import lt
+from twisted.internet import reactor
+
+from deluge_peerbanhelperadapter.blocklist import IntervalSet, format_ip, parse_ip
+
+log = logging.getLogger(__name__)
+
+# 合并封禁变更的时间窗口（秒）
+DEFAULT_APPLY_DELAY = 0.5
+# 变更的范围数超过 max(该值, 过滤规则数 / _REBUILD_RATIO) 时重新构建过滤器，而非增量更新
+_REBUILD_THRESHOLD = 64
+_REBUILD_RATIO = 4
+
+
+class IpFilterApplier:
+    """将封禁列表应用到 libtorrent
+
+    创建时读取 session.get_ip_filter() 中已阻止的范围作为基础规则（例如 Deluge Blocklist 插件添加的规则），
+    之后每次应用的过滤器都由基础规则与封禁列表组成，停用时通过 restore 恢复为基础规则。
+    每次应用与恢复前检查会话的过滤器是否仍是上次应用的过滤器，已被其他来源替换（例如 Blocklist 插件重新导入）时
+    重新读取基础规则，不会以过时的基础规则覆盖其他来源之后设置的规则。
+    保留上次应用的过滤器与封禁列表版本，再次应用时只将变更过的范围重置为允许，
+    再按基础规则与封禁列表重新加入其中的规则；变更较多或版本已过期时重新构建。
+    时间窗口内的多次变更只会触发一次 set_ip_filter。
+    """
+
+    def __init__(self, session, blocklist, delay=DEFAULT_APPLY_DELAY, metrics=None):
+        self.session = session
+        self.blocklist = blocklist
+        self.delay = delay
+        # AdapterMetrics，记录构建与应用过滤器的耗时
+        self.metrics = metrics
+        # 已应用到 libtorrent 的次数
+        self.apply_count = 0
+        # 地址族 -> 基础规则中已阻止的区间
+        self._base = self._capture(session.get_ip_filter())
+        count = len(self._base[4]) + len(self._base[6])
+        if count:
+            log.info("PeerBanHelperAdapter: 保留 %d 条已有的 IP 过滤规则", count)
+        # 上次应用的过滤器及其对应的封禁列表版本
+        self._filter = None
+        self._version = None
+        # 上次应用的过滤器的 export_filter()，用于判断会话的过滤器是否已被其他来源替换
+        self._exported = None
+        self._call = None
+
+    @property
+    def pending(self) -> bool:
+        return self._call is not None and self._call.active()
+
+    def schedule(self):
+        """在时间窗口结束时应用封禁列表，窗口内的重复调用会被合并"""
+        if not self.pending:
+            self._call = reactor.callLater(self.delay, self.flush)
+
+    def flush(self):
+        """立即应用封禁列表"""
+        self.cancel()
+        start = perf_counter()
+        self._refresh_base()
+        ip_filter, incremental = self._build()
+        built = perf_counter()
+        self.session.set_ip_filter(ip_filter)
+        self._exported = ip_filter.export_filter()
+        self.apply_count += 1
+        if self.metrics is not None and self.metrics.enabled:
+            self.metrics.observe("ip_filter.update" if incremental else "ip_filter.build", built - start)
+            self.metrics.observe("ip_filter.apply", perf_counter() - built)
+        log.debug("PeerBanHelperAdapter: 已应用 %d 条 IP 过滤规则", self.blocklist.rule_count)
+
+    def _build(self):
+        """返回 (与封禁列表一致的过滤器, 是否为增量更新)"""
+        blocklist = self.blocklist
+        changed = None
+        if self._filter is not None:
+            changed = blocklist.changed_ranges(self._version)
+        if changed is None or len(changed) > max(_REBUILD_THRESHOLD, blocklist.rule_count // _REBUILD_RATIO):
+            ip_filter = self._base_filter()
+            for first, last in blocklist.rules():
+                ip_filter.add_rule(first, last, 1)  # 1 阻止通过
+            incremental = False
+        else:
+            ip_filter = self._filter
+            for family, start, end in changed:
+                ip_filter.add_rule(format_ip(family, start), format_ip(family, end), 0)  # 0 允许通过
+                for first, last in self._base[family].within(start, end):
+                    ip_filter.add_rule(format_ip(family, first), format_ip(family, last), 1)
+                for first, last in blocklist.rules_within(family, start, end):
+                    ip_filter.add_rule(first, last, 1)
+            incremental = True
+        self._filter = ip_filter
+        self._version = blocklist.version
+        return ip_filter, incremental
+
+    def restore(self):
+        """取消尚未应用的变更，将 libtorrent 过滤器恢复为基础规则"""
+        self.cancel()
+        self._refresh_base()
+        self.session.set_ip_filter(self._base_filter())
+        self._filter = None
+        self._version = None
+        self._exported = None
+
+    def _refresh_base(self):
+        """会话的过滤器已被其他来源替换时重新读取基础规则，之后的应用需要重新构建"""
+        if self._exported is None:
+            return
+        current = self.session.get_ip_filter()
+        if current.export_filter() == self._exported:
+            return
+        base = self._capture(current)
+        applied = self._capture(self._filter)
+        # 上次应用时由封禁列表添加的部分
+        ours = {family: applied[family].difference(self._base[family]) for family in applied}
+        if not any(len(ours[family].difference(base[family])) for family in base):
+            # 其他来源在 PBH 的过滤器上追加规则时，由封禁列表添加的部分不计入基础规则
+            base = {family: intervals.difference(ours[family]) for family, intervals in base.items()}
+        self._base = base
+        self._filter = None
+        self._version = None
+        self._exported = None
+        log.info(
+            "PeerBanHelperAdapter: IP 过滤规则已被其他来源替换，重新读取 %d 条已有的规则",
+            len(base[4]) + len(base[6]),
+        )
+
+    def _base_filter(self):
+        ip_filter = lt.ip_filter()
+        for family, intervals in self._base.items():
+            for start, end in intervals:
+                ip_filter.add_rule(format_ip(family, start), format_ip(family, end), 1)
+        return ip_filter
+
+    @staticmethod
+    def _capture(ip_filter):
+        """返回 地址族 -> 过滤器中已阻止的区间"""
+        ranges = {4: [], 6: []}
+        v4, v6 = ip_filter.export_filter()
+        for item in list(v4) + list(v6):
+            # export_filter 产生覆盖全部地址的连续范围，以起始地址的访问标志为该范围的标志
+            first, last = item[0], item[1]
+            if not ip_filter.access(first) & 1:
+                continue
+            family, start = parse_ip(first)
+            _, end = parse_ip(last)
+            ranges[family].append((start, end))
+        return {family: IntervalSet.from_ranges(items) for family, items in ranges.items()}
+
+    def cancel(self):
+        if self.pending:
+            self._call.cancel()
+        self._call = None
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2024 azicen <chenjiazi2000@outlook.com>
+#
+# This file is part of PeerBanHelperAdapter and is licensed under MIT license, or later,
+# with the additional special exception to link portions of this program with
+# the OpenSSL library. See LICENSE for more details.
+from __future__ import unicode_literals
+
+import logging
+
+from deluge._libtorrent import lt
+
+log = logging.getLogger(__name__)
+
+
+def available_metrics():
+    """返回 libtorrent 支持的全部会话统计名称 -> 计数器数组下标"""
+    return {metric.name: metric.value_index for metric in lt.session_stats_metrics()}
+
+
+class MetricReader:
+    """从 session_stats_alert 读取指定的会话统计
+
+    计数器名称在创建时一次性解析为计数器数组下标，每次采样按下标直接读取，
+    不再由名称构造完整的统计字典。绑定不提供计数器数组时回退为按名称读取 values。
+    """
+
+    def __init__(self, names):
+        indices = available_metrics()
+        unknown = [name for name in names if name not in indices]
+        if unknown:
+            log.warning("PeerBanHelperAdapter: 忽略不支持的会话统计: %s", ", ".join(unknown))
+        # 去重并保持顺序
+        self.names = tuple(dict.fromkeys(name for name in names if name in indices))
+        self.indices = tuple(indices[name] for name in self.names)
+
+    def read(self, alert):
+        """返回 计数器名称 -> 值"""
+        counters = getattr(alert, "counters", None)
+        if counters is not None:
+            values = counters()
+            return dict(zip(self.names, [values[index] for index in self.indices]))
+        values = alert.values
+        return {name: values.get(name, 0) for name in self.names}
@@ -1,7 +1,14 @@
-from dataclasses import asdict, dataclass
+from dataclasses import dataclass, fields
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def field_names(cls) -> tuple:
+    return tuple(f.name for f in fields(cls))
 
 
 @dataclass
 class BaseModel:
     def dist(self) -> dict:
-        return asdict(self)
+        # 字段均为标量，无需 asdict 的递归深拷贝
+        return {name: getattr(self, name) for name in field_names(type(self))}
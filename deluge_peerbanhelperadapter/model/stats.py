@@ -1,7 +1,7 @@
-from dataclasses import dataclass, asdict, fields
+from dataclasses import dataclass
 from datetime import datetime
 
-from deluge_peerbanhelperadapter.model.base import BaseModel
+from deluge_peerbanhelperadapter.model.base import BaseModel, field_names
 
 LT_STATUS_NAMES = [
     "net.sent_payload_bytes",
@@ -24,6 +24,52 @@ LT_STATUS_NAMES = [
     "peer.num_peers_connected",
 ]
 
+# PersistenceStatus 累计字段 -> 组成该字段的 libtorrent 计数器
+TOTAL_COUNTERS = {
+    "total_payload_download": ("net.recv_payload_bytes",),
+    "total_payload_upload": ("net.sent_payload_bytes",),
+    "ip_overhead_download": ("net.recv_ip_overhead_bytes",),
+    "ip_overhead_upload": ("net.sent_ip_overhead_bytes",),
+    "tracker_download": ("net.recv_tracker_bytes",),
+    "tracker_upload": ("net.sent_tracker_bytes",),
+    "dht_download": ("dht.dht_bytes_in",),
+    "dht_upload": ("dht.dht_bytes_out",),
+    # 被丢弃的重复下载字节数（从不同的对等节点下载） + 因哈希校验失败而丢弃的已下载字节数
+    "total_wasted": ("net.recv_redundant_bytes", "net.recv_failed_bytes"),
+    "total_download": ("net.recv_bytes", "net.recv_ip_overhead_bytes"),
+    "total_upload": ("net.sent_bytes", "net.sent_ip_overhead_bytes"),
+}
+
+# SessionStatus 速率字段 -> 组成该速率的 libtorrent 计数器
+RATE_COUNTERS = {
+    "payload_download_rate": ("net.recv_payload_bytes",),
+    "payload_upload_rate": ("net.sent_payload_bytes",),
+    "download_rate": ("net.recv_bytes", "net.recv_ip_overhead_bytes"),
+    "upload_rate": ("net.sent_bytes", "net.sent_ip_overhead_bytes"),
+    "ip_overhead_download_rate": ("net.recv_ip_overhead_bytes",),
+    "ip_overhead_upload_rate": ("net.sent_ip_overhead_bytes",),
+    "dht_download_rate": ("dht.dht_bytes_in",),
+    "dht_upload_rate": ("dht.dht_bytes_out",),
+    "tracker_download_rate": ("net.recv_tracker_bytes",),
+    "tracker_upload_rate": ("net.sent_tracker_bytes",),
+}
+
+# SessionStatus 瞬时字段 -> libtorrent 计数器
+GAUGE_COUNTERS = {
+    "dht_nodes": "dht.dht_nodes",
+    "disk_read_queue": "peer.num_peers_up_disk",
+    "disk_write_queue": "peer.num_peers_down_disk",
+    "peers_count": "peer.num_peers_connected",
+}
+
+# 需要计算速率的计数器
+LT_RATE_NAMES = tuple(sorted({name for names in RATE_COUNTERS.values() for name in names}))
+
+
+def combine_rates(rates) -> dict:
+    """将 计数器名称 -> 速率 合并为 SessionStatus 速率字段 -> 速率"""
+    return {field: sum(rates[name] for name in names) for field, names in RATE_COUNTERS.items()}
+
 
 @dataclass
 class PersistenceStatus(BaseModel):
@@ -81,11 +127,28 @@ class PersistenceStatus(BaseModel):
             return self
         return NotImplemented
 
+    def __sub__(self, other):
+        # 扣除基准值，用于计算自某一时刻以来的增量
+        if isinstance(other, PersistenceStatus):
+            self.total_payload_download = self.total_payload_download - other.total_payload_download
+            self.total_payload_upload = self.total_payload_upload - other.total_payload_upload
+            self.ip_overhead_download = self.ip_overhead_download - other.ip_overhead_download
+            self.ip_overhead_upload = self.ip_overhead_upload - other.ip_overhead_upload
+            self.tracker_download = self.tracker_download - other.tracker_download
+            self.tracker_upload = self.tracker_upload - other.tracker_upload
+            self.dht_download = self.dht_download - other.dht_download
+            self.dht_upload = self.dht_upload - other.dht_upload
+            self.total_wasted = self.total_wasted - other.total_wasted
+            self.total_download = self.total_download - other.total_download
+            self.total_upload = self.total_upload - other.total_upload
+            return self
+        return NotImplemented
+
     def persistence_dist(self) -> dict:
-        return asdict(self)
+        return self.dist()
 
 
-_persistence_fields = {field.name for field in fields(PersistenceStatus)}
+_persistence_fields = field_names(PersistenceStatus)
 
 
 @dataclass
@@ -132,7 +195,21 @@ class SessionStatus(PersistenceStatus):
     # 已连接的对等方数量(num_peers_connected)
     peers_count: int = 0
 
+    def update_from_sample(self, timestamp, values, rates):
+        """由一次会话统计采样更新
+
+        Args:
+            timestamp (float): 采样时间戳
+            values (dict): libtorrent 计数器名称 -> 值
+            rates (dict): libtorrent 计数器名称 -> 速率
+        """
+        self.stats_last_timestamp = int(timestamp)
+        for field, names in TOTAL_COUNTERS.items():
+            setattr(self, field, sum(values.get(name, 0) for name in names))
+        for field, name in GAUGE_COUNTERS.items():
+            setattr(self, field, values.get(name, 0))
+        for field, rate in combine_rates(rates).items():
+            setattr(self, field, rate)
 
     def persistence_dist(self) -> dict:
-        dist = asdict(self)
-        return {field: dist[field] for field in _persistence_fields}
+        return {field: getattr(self, field) for field in _persistence_fields}
@@ -1,7 +1,7 @@
-from dataclasses import asdict, dataclass, field
+from dataclasses import dataclass, field
 from typing import List
 
-from deluge_peerbanhelperadapter.model.base import BaseModel
+from deluge_peerbanhelperadapter.model.base import BaseModel, field_names
 
 
 @dataclass
@@ -63,8 +63,10 @@ class Peer(BaseModel):
     # 进度每分钟百分比
     progress_ppm: int = 0
 
-    def dist(self) -> dict:
-        return asdict(self)
+
+# Peer 全部字段名，按定义顺序
+PEER_FIELDS = field_names(Peer)
+
 
 @dataclass
 class Torrent(BaseModel):
@@ -86,9 +88,6 @@ class Torrent(BaseModel):
     # 是否为私有种子
     priv: bool = False
 
-    def dist(self) -> dict:
-        return asdict(self)
-
 
 @dataclass
 class ActiveTorrent(Torrent):
@@ -99,3 +98,10 @@ class ActiveTorrent(Torrent):
     download_payload_rate: int = 0
 
     peers: List[Peer] = field(default_factory=list)
+
+
+# Torrent 全部字段名，按定义顺序
+TORRENT_FIELDS = field_names(Torrent)
+
+# ActiveTorrent 全部字段名（不含 peers），按定义顺序
+ACTIVE_TORRENT_FIELDS = tuple(name for name in field_names(ActiveTorrent) if name != "peers")
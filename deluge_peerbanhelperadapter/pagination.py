@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2024 azicen <chenjiazi2000@outlook.com>
+#
+# This file is part of PeerBanHelperAdapter and is licensed under MIT license, or later,
+# with the additional special exception to link portions of this program with
+# the OpenSSL library. See LICENSE for more details.
+from __future__ import unicode_literals
+
+import time
+from collections import OrderedDict
+
+from deluge_peerbanhelperadapter.cursor import format_cursor, new_epoch
+
+# 分页令牌空闲过期时间（秒）
+DEFAULT_CURSOR_TTL = 60
+# 同时保留的分页游标数量上限
+DEFAULT_MAX_CURSORS = 8
+
+
+class _Cursor:
+    __slots__ = ("iterator", "pending", "context", "expires_at")
+
+    def __init__(self, iterator, context, expires_at):
+        # 惰性产生 (种子字典, 节点元组列表) 的迭代器
+        self.iterator = iterator
+        # 上一页未能放下、留待下一页的条目
+        self.pending = None
+        # 创建游标时协商的格式与字段，后续页沿用
+        self.context = context
+        self.expires_at = expires_at
+
+
+class Paginator:
+    """基于迭代器的分页游标
+
+    首页创建游标时固定种子集合，之后每页只从迭代器中取出本页需要的种子并构建其节点，
+    内存占用只与页大小相关，与活跃种子总数无关。
+    """
+
+    def __init__(self, ttl=DEFAULT_CURSOR_TTL, max_cursors=DEFAULT_MAX_CURSORS):
+        self.epoch = new_epoch()
+        self.ttl = ttl
+        self.max_cursors = max_cursors
+        self._next_id = 0
+        self._cursors: OrderedDict[str, _Cursor] = OrderedDict()
+
+    def open(self, iterator, context) -> str:
+        """创建游标并返回其令牌
+
+        Args:
+            iterator: 惰性产生 (种子字典, 节点元组列表) 的迭代器
+            context: 与游标一同保存的上下文
+        """
+        self._prune()
+        while len(self._cursors) >= self.max_cursors:
+            self._cursors.popitem(last=False)
+
+        self._next_id += 1
+        token = format_cursor(self.epoch, self._next_id)
+        self._cursors[token] = _Cursor(iterator, context, time.monotonic() + self.ttl)
+        return token
+
+    def context(self, token):
+        """返回游标上下文，令牌无效或已过期时抛出 ValueError"""
+        self._prune()
+        cursor = self._cursors.get(token)
+        if cursor is None:
+            raise ValueError("分页令牌无效或已过期: %s" % token)
+        return cursor.context
+
+    def take(self, token, page_size):
+        """取出下一页
+
+        每页至少包含一个种子，其余种子在节点总数不超过 page_size 时加入本页。
+
+        Args:
+            token (str): 游标令牌
+            page_size (int): 每页节点数上限
+
+        Returns:
+            (本页条目列表, 下一页令牌)，没有更多数据时下一页令牌为 None
+        """
+        cursor = self._cursors.get(token)
+        if cursor is None:
+            raise ValueError("分页令牌无效或已过期: %s" % token)
+
+        page = []
+        peers = 0
+        while True:
+            item = cursor.pending
+            cursor.pending = None
+            if item is None:
+                item = next(cursor.iterator, None)
+                if item is None:
+                    del self._cursors[token]
+                    return page, None
+            if page and peers + len(item[1]) > page_size:
+                cursor.pending = item
+                break
+            page.append(item)
+            peers += len(item[1])
+
+        cursor.expires_at = time.monotonic() + self.ttl
+        return page, token
+
+    def _prune(self):
+        now = time.monotonic()
+        for token in [k for k, v in self._cursors.items() if v.expires_at <= now]:
+            del self._cursors[token]
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2024 azicen <chenjiazi2000@outlook.com>
+#
+# This file is part of PeerBanHelperAdapter and is licensed under MIT license, or later,
+# with the additional special exception to link portions of this program with
+# the OpenSSL library. See LICENSE for more details.
+from __future__ import unicode_literals
+
+import time
+from array import array
+
+# 每个节点默认保留的采样数
+DEFAULT_SAMPLES = 8
+# 同一节点两次采样的最小间隔（秒），更密集的采集不会写入新的采样
+DEFAULT_MIN_INTERVAL = 1.0
+# 超过该时长（秒）未被采样的节点视为已断开，防止漏收断开事件时无限增长
+DEFAULT_MAX_AGE = 600
+# 清理过期节点的最小间隔（秒）
+_PRUNE_INTERVAL = 60
+
+# 每个槽位的布局：写入位置、采样数，随后为 samples 组（时间戳、上传量、下载量、进度）
+_HEADER = 2
+_FIELDS = 4
+
+
+class PeerHistory:
+    """节点采样的环形缓冲区
+
+    所有节点共用一个 array('d')，每个 (torrent_id, ip, port) 占用一个定长槽位，
+    保存最近若干次采集到的上传量、下载量与进度，由此计算平滑速率与进度变化。
+    节点断开后释放槽位供后续节点复用，内存只与同时连接的节点数量相关。
+    """
+
+    def __init__(self, samples=DEFAULT_SAMPLES, min_interval=DEFAULT_MIN_INTERVAL, max_age=DEFAULT_MAX_AGE):
+        self.samples = samples
+        self.min_interval = min_interval
+        self.max_age = max_age
+        self._stride = _HEADER + samples * _FIELDS
+        self._data = array("d")
+        self._empty_slot = array("d", [0.0]) * self._stride
+        # (torrent_id, ip, port) -> 槽位
+        self._slots: dict[tuple, int] = {}
+        self._free: list[int] = []
+        self._last_prune = time.time()
+
+    def __len__(self):
+        return len(self._slots)
+
+    def record_peers(self, torrent_id, lt_peers, now):
+        """记录种子全部已连接节点的一次采样
+
+        Args:
+            torrent_id (str): 种子 ID
+            lt_peers (list): libtorrent peer_info 列表
+            now (float): 采样时间戳
+        """
+        record = self.record
+        for lt_peer in lt_peers:
+            if lt_peer.flags & (lt_peer.connecting | lt_peer.handshake):
+                continue
+            ip, port = lt_peer.ip
+            record((torrent_id, ip, port), now, lt_peer.total_upload, lt_peer.total_download, lt_peer.progress)
+
+    def record(self, key, timestamp, total_upload, total_download, progress):
+        data = self._data
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._allocate(key)
+        base = slot * self._stride
+        head = int(data[base])
+        count = int(data[base + 1])
+        if count:
+            last = base + _HEADER + (head - 1) % self.samples * _FIELDS
+            if timestamp - data[last] < self.min_interval:
+                return
+
+        offset = base + _HEADER + head * _FIELDS
+        data[offset] = timestamp
+        data[offset + 1] = total_upload
+        data[offset + 2] = total_download
+        data[offset + 3] = progress
+        data[base] = (head + 1) % self.samples
+        data[base + 1] = min(count + 1, self.samples)
+
+    def evict(self, key):
+        """释放节点的槽位"""
+        slot = self._slots.pop(key, None)
+        if slot is not None:
+            self._free.append(slot)
+
+    def prune(self, now):
+        """释放长时间未被采样的节点，最多每分钟执行一次"""
+        if now - self._last_prune < _PRUNE_INTERVAL:
+            return
+        self._last_prune = now
+        data = self._data
+        before = now - self.max_age
+        for key, slot in list(self._slots.items()):
+            base = slot * self._stride
+            last = base + _HEADER + (int(data[base]) - 1) % self.samples * _FIELDS
+            if data[last] < before:
+                self.evict(key)
+
+    def query(self, torrent_ids=None):
+        """按种子返回节点统计
+
+        Args:
+            torrent_ids (list[str]): 需要的种子 ID，为空时返回全部种子
+
+        Returns:
+            dict[str, list[dict]]: torrent_id -> [{"ip", "port", "samples", "window",
+                "upload_rate", "download_rate", "progress", "progress_delta"}]，
+                window 为采样窗口的秒数，速率为窗口内的平均值
+        """
+        wanted = set(torrent_ids) if torrent_ids else None
+        result = {}
+        for (torrent_id, ip, port), slot in list(self._slots.items()):
+            if wanted is not None and torrent_id not in wanted:
+                continue
+            stats = self._stats(slot)
+            if stats is None:
+                continue
+            stats["ip"] = ip
+            stats["port"] = port
+            result.setdefault(torrent_id, []).append(stats)
+        return result
+
+    def _stats(self, slot):
+        # 不足两次采样时返回 None
+        data = self._data
+        base = slot * self._stride
+        head = int(data[base])
+        count = int(data[base + 1])
+        if count < 2:
+            return None
+        first = base + _HEADER + (head - count) % self.samples * _FIELDS
+        last = base + _HEADER + (head - 1) % self.samples * _FIELDS
+        window = data[last] - data[first]
+        if window <= 0:
+            return None
+        return {
+            "samples": count,
+            "window": window,
+            # 窗口内的平均速率，计数器重置（重新连接）时不为负
+            "upload_rate": max(data[last + 1] - data[first + 1], 0) / window,
+            "download_rate": max(data[last + 2] - data[first + 2], 0) / window,
+            "progress": data[last + 3],
+            "progress_delta": data[last + 3] - data[first + 3],
+        }
+
+    def _allocate(self, key):
+        if self._free:
+            slot = self._free.pop()
+            base = slot * self._stride
+            self._data[base] = 0
+            self._data[base + 1] = 0
+        else:
+            slot = len(self._data) // self._stride
+            self._data.extend(self._empty_slot)
+        self._slots[key] = slot
+        return slot
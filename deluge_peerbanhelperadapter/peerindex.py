@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2024 azicen <chenjiazi2000@outlook.com>
+#
+# This file is part of PeerBanHelperAdapter and is licensed under MIT license, or later,
+# with the additional special exception to link portions of this program with
+# the OpenSSL library. See LICENSE for more details.
+from __future__ import unicode_literals
+
+
+class PeerIndex:
+    """节点 IP -> 种子的倒排索引
+
+    每次采集种子节点时按种子增量维护，只处理新增与离开的 IP，
+    封禁时按 IP 查找所在的种子，无需遍历全部节点。
+    """
+
+    def __init__(self):
+        # torrent_id -> 该种子已连接节点的 IP 集合
+        self._by_torrent: dict[str, frozenset] = {}
+        # ip -> 种子 ID 集合
+        self._by_ip: dict[str, set] = {}
+
+    def __len__(self):
+        return len(self._by_ip)
+
+    def update(self, torrent_id, ips):
+        """更新种子当前已连接节点的 IP"""
+        current = frozenset(ips)
+        previous = self._by_torrent.get(torrent_id, frozenset())
+        if current == previous:
+            return
+        self._by_torrent[torrent_id] = current
+        for ip in previous - current:
+            self._unlink(ip, torrent_id)
+        for ip in current - previous:
+            self._by_ip.setdefault(ip, set()).add(torrent_id)
+
+    def retain(self, torrent_ids):
+        """只保留指定种子的索引"""
+        torrent_ids = set(torrent_ids)
+        for torrent_id in [k for k in self._by_torrent if k not in torrent_ids]:
+            self.remove_torrent(torrent_id)
+
+    def remove_torrent(self, torrent_id):
+        for ip in self._by_torrent.pop(torrent_id, frozenset()):
+            self._unlink(ip, torrent_id)
+
+    def match(self, blocklist, entries):
+        """查找被封禁条目覆盖的已连接节点
+
+        单个 IP 条目直接查表；CIDR 与范围条目需检查索引中的每个 IP。
+
+        Args:
+            blocklist (Blocklist): 用于判断 IP 是否被覆盖
+            entries (list[str]): 规范条目
+
+        Returns:
+            dict[str, set]: ip -> 种子 ID 集合
+        """
+        matched = {}
+        wide = False
+        for entry in entries:
+            torrents = self._by_ip.get(entry)
+            if torrents:
+                matched[entry] = set(torrents)
+            elif "/" in entry or "-" in entry:
+                wide = True
+        if wide:
+            for ip, torrents in list(self._by_ip.items()):
+                if ip not in matched and blocklist.covers(ip):
+                    matched[ip] = set(torrents)
+        return matched
+
+    def discard(self, ip):
+        """移除某个 IP 的全部连接"""
+        for torrent_id in self._by_ip.pop(ip, set()):
+            ips = self._by_torrent.get(torrent_id)
+            if ips is not None:
+                self._by_torrent[torrent_id] = ips - {ip}
+
+    def _unlink(self, ip, torrent_id):
+        torrents = self._by_ip.get(ip)
+        if torrents is not None:
+            torrents.discard(torrent_id)
+            if not torrents:
+                del self._by_ip[ip]
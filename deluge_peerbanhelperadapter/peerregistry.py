@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2024 azicen <chenjiazi2000@outlook.com>
+#
+# This file is part of PeerBanHelperAdapter and is licensed under MIT license, or later,
+# with the additional special exception to link portions of this program with
+# the OpenSSL library. See LICENSE for more details.
+from __future__ import unicode_literals
+
+import time
+from collections import deque
+
+from deluge_peerbanhelperadapter.cursor import entries_since, format_cursor, new_epoch, parse_cursor
+
+# 事件日志保留的条目数，游标早于最旧的条目时需要全量同步
+DEFAULT_LOG_SIZE = 100000
+
+_CONNECTED = 1
+_DISCONNECTED = 2
+_BANNED = 3
+_BLOCKED = 4
+
+
+def _alert_key(alert):
+    """返回节点事件的 (torrent_id, ip, port)，种子已失效时返回 None"""
+    try:
+        torrent_id = str(alert.handle.info_hash())
+    except RuntimeError:
+        return None
+    ip, port = alert.endpoint
+    return torrent_id, ip, port
+
+
+def _peer_dict(key):
+    return {"torrent_id": key[0], "ip": key[1], "port": key[2]}
+
+
+class PeerRegistry:
+    """由 libtorrent 节点事件维护的已连接节点登记表
+
+    通过 AlertManager 订阅节点连接、断开、封禁与拦截事件，按序号记录到有界的事件日志中，
+    客户端凭游标只获取自上次调用以来的变化，无需对每个种子调用 get_peer_info。
+    """
+
+    def __init__(self, log_size=DEFAULT_LOG_SIZE):
+        self.epoch = new_epoch()
+        self.sequence = 0
+        # (torrent_id, ip, port) -> 连接建立的时间戳
+        self.peers: dict[tuple, float] = {}
+        # (序号, 事件, (torrent_id, ip, port))
+        self._log = deque(maxlen=log_size)
+        # 节点断开时以 (torrent_id, ip, port) 调用的函数
+        self.disconnect_listeners = []
+        # 各类事件的累计次数
+        self.counters = {
+            "connected": 0,
+            "disconnected": 0,
+            "banned": 0,
+            "blocked": 0,
+            "incoming": 0,
+        }
+
+    def __len__(self):
+        return len(self.peers)
+
+    @property
+    def cursor(self) -> str:
+        return format_cursor(self.epoch, self.sequence)
+
+    @property
+    def floor(self) -> int:
+        """仍可进行增量同步的最小序号"""
+        if len(self._log) < self._log.maxlen:
+            return 0
+        return self._log[0][0] - 1
+
+    def handlers(self):
+        """返回 alert 类型 -> 处理函数，用于 AlertManager.register_handler"""
+        return {
+            "peer_connect_alert": self.on_peer_connect,
+            "peer_disconnected_alert": self.on_peer_disconnected,
+            "peer_ban_alert": self.on_peer_ban,
+            "peer_blocked_alert": self.on_peer_blocked,
+            "incoming_connection_alert": self.on_incoming_connection,
+        }
+
+    def seed(self, torrent_id, endpoints):
+        """登记订阅事件之前已建立的连接，不写入事件日志
+
+        Args:
+            torrent_id (str): 种子 ID
+            endpoints (list[tuple]): 节点的 (ip, port)
+        """
+        now = time.time()
+        for ip, port in endpoints:
+            self.peers.setdefault((torrent_id, ip, port), now)
+
+    def on_peer_connect(self, alert):
+        key = _alert_key(alert)
+        if key is None:
+            return
+        self.peers[key] = time.time()
+        self._record(_CONNECTED, key)
+        self.counters["connected"] += 1
+
+    def on_peer_disconnected(self, alert):
+        key = _alert_key(alert)
+        if key is None or self.peers.pop(key, None) is None:
+            # 未完成握手的连接不会产生 peer_connect_alert
+            return
+        self._record(_DISCONNECTED, key)
+        self.counters["disconnected"] += 1
+        for listener in self.disconnect_listeners:
+            listener(key)
+
+    def on_peer_ban(self, alert):
+        key = _alert_key(alert)
+        if key is None:
+            return
+        self._record(_BANNED, key)
+        self.counters["banned"] += 1
+
+    def on_peer_blocked(self, alert):
+        key = _alert_key(alert)
+        if key is None:
+            return
+        self._record(_BLOCKED, key)
+        self.counters["blocked"] += 1
+
+    def remove_torrent(self, torrent_id):
+        """移除种子的全部已连接节点，按断开记录
+
+        种子移除后其 peer_disconnected_alert 无法再解析出种子 ID，由 TorrentRemovedEvent 调用。
+        """
+        keys = [key for key in self.peers if key[0] == torrent_id]
+        for key in keys:
+            del self.peers[key]
+            self._record(_DISCONNECTED, key)
+            for listener in self.disconnect_listeners:
+                listener(key)
+
+    def on_incoming_connection(self, alert):
+        # 尚未关联到种子，只计数
+        self.counters["incoming"] += 1
+
+    def parse_cursor(self, cursor):
+        """解析游标，游标无效或已过期时返回 None"""
+        return parse_cursor(cursor, self.epoch, self.floor, self.sequence)
+
+    def changes(self, cursor=None):
+        """返回自游标以来的节点变化
+
+        游标为空、无效或已过期时返回当前全部已连接节点（full 为 True），客户端需丢弃本地状态。
+        同一节点在期间多次连接与断开时，只按最后一次事件返回。
+
+        Returns:
+            {"cursor", "full", "connected", "disconnected", "banned", "blocked"}，
+            各列表的元素为 {"torrent_id", "ip", "port"}
+        """
+        result = {
+            "cursor": self.cursor,
+            "full": False,
+            "connected": [],
+            "disconnected": [],
+            "banned": [],
+            "blocked": [],
+        }
+        sequence = self.parse_cursor(cursor)
+        if sequence is None:
+            result["full"] = True
+            result["connected"] = [_peer_dict(key) for key in self.peers]
+            return result
+
+        events = list(entries_since(self._log, sequence))
+
+        states = {}
+        for _, event, key in reversed(events):
+            if event == _BANNED:
+                result["banned"].append(_peer_dict(key))
+            elif event == _BLOCKED:
+                result["blocked"].append(_peer_dict(key))
+            else:
+                states[key] = event
+        for key, event in states.items():
+            if event == _CONNECTED:
+                result["connected"].append(_peer_dict(key))
+            else:
+                result["disconnected"].append(_peer_dict(key))
+        return result
+
+    def _record(self, event, key):
+        self.sequence += 1
+        self._log.append((self.sequence, event, key))
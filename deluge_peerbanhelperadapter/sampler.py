@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2024 azicen <chenjiazi2000@outlook.com>
+#
+# This file is part of PeerBanHelperAdapter and is licensed under MIT license, or later,
+# with the additional special exception to link portions of this program with
+# the OpenSSL library. See LICENSE for more details.
+from __future__ import unicode_literals
+
+import logging
+import math
+import time
+from collections import deque, namedtuple
+
+from twisted.internet.task import LoopingCall
+
+log = logging.getLogger(__name__)
+
+# 默认采集间隔（秒）
+DEFAULT_INTERVAL = 5
+# 保留的采样数
+DEFAULT_HISTORY = 120
+# EWMA 平滑的时间常数（秒）
+DEFAULT_TIME_CONSTANT = 30.0
+
+# 一次会话统计采样：时间戳与 计数器名称 -> 值
+SessionSample = namedtuple("SessionSample", ["timestamp", "values"])
+
+
+class SessionSampler:
+    """按固定间隔采集 libtorrent 会话统计
+
+    由 LoopingCall 定期调用 session.post_session_stats，在 session_stats_alert 中通过 MetricReader 读取计数器，
+    保存最近的采样序列并计算相邻两次采样间的速率与 EWMA 平滑速率。
+    Deluge 本身每 0.5 秒触发一次 session_stats_alert，距上次采样不足一个采集间隔的 alert 会被丢弃。
+    RPC 调用只读取已计算好的结果，不再等待异步查询。
+    """
+
+    def __init__(
+        self,
+        session,
+        reader,
+        rate_names,
+        history=DEFAULT_HISTORY,
+        time_constant=DEFAULT_TIME_CONSTANT,
+    ):
+        self.session = session
+        # MetricReader，决定采集哪些计数器
+        self.reader = reader
+        # 需要计算速率的计数器名称（单调递增的计数器）
+        self.rate_names = tuple(rate_names)
+        self.time_constant = time_constant
+        self.samples = deque(maxlen=history)
+        # 计数器名称 -> 最近两次采样间的速率（每秒）
+        self.rates = {name: 0.0 for name in self.rate_names}
+        # 计数器名称 -> EWMA 平滑速率（每秒）
+        self.smoothed = {name: 0.0 for name in self.rate_names}
+        # 每次采样后以 SessionSample 调用的函数
+        self.listeners = []
+        self.interval = 0
+        self._loop = None
+
+    @property
+    def running(self) -> bool:
+        return self._loop is not None and self._loop.running
+
+    @property
+    def latest(self):
+        """最近一次采样，尚未采样时返回 None"""
+        return self.samples[-1] if self.samples else None
+
+    def start(self, interval=DEFAULT_INTERVAL):
+        """以指定间隔（秒）开始采集，间隔不大于 0 时停止"""
+        if self.running and interval == self.interval:
+            return
+        self.stop()
+        self.interval = interval
+        if interval <= 0:
+            return
+        self._loop = LoopingCall(self.session.post_session_stats)
+        self._loop.start(interval, now=True)
+
+    def stop(self):
+        if self.running:
+            self._loop.stop()
+        self._loop = None
+
+    def on_session_stats(self, alert):
+        """session_stats_alert 处理函数"""
+        if self.interval <= 0:
+            return
+        now = time.time()
+        latest = self.latest
+        # 允许少量提前，避免 alert 的到达延迟使采样间隔变为两个周期
+        if latest is not None and now - latest.timestamp < self.interval * 0.9:
+            return
+        self.add(now, self.reader.read(alert))
+
+    def add(self, timestamp, values):
+        """写入一次采样并更新速率"""
+        previous = self.latest
+        sample = SessionSample(timestamp, values)
+        if previous is not None:
+            interval = timestamp - previous.timestamp
+            if interval <= 0:
+                return
+            # 时间间隔不固定（其他组件同样会触发 session_stats_alert），按实际间隔计算权重
+            alpha = 1 - math.exp(-interval / self.time_constant)
+            first = len(self.samples) == 1
+            for name in self.rate_names:
+                # libtorrent 计数器不会回退，出现时视为 0
+                rate = max(values.get(name, 0) - previous.values.get(name, 0), 0) / interval
+                self.rates[name] = rate
+                if first:
+                    self.smoothed[name] = rate
+                else:
+                    self.smoothed[name] += alpha * (rate - self.smoothed[name])
+        self.samples.append(sample)
+
+        for listener in self.listeners:
+            try:
+                listener(sample)
+            except Exception as ex:
+                log.error("PeerBanHelperAdapter: 处理会话统计采样失败: %s", ex)
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2024 azicen <chenjiazi2000@outlook.com>
+#
+# This file is part of PeerBanHelperAdapter and is licensed under MIT license, or later,
+# with the additional special exception to link portions of this program with
+# the OpenSSL library. See LICENSE for more details.
+from __future__ import unicode_literals
+
+from deluge_peerbanhelperadapter.cursor import format_cursor, new_epoch, parse_cursor
+
+# 令牌保留的代数，超过后客户端需要全量同步
+DEFAULT_RETENTION = 16
+
+
+class _TorrentEntry:
+    __slots__ = ("info", "added_gen", "touched_gen", "peers", "removed_peers")
+
+    def __init__(self, info, generation):
+        # 种子信息（不包含 peers）
+        self.info = info
+        self.added_gen = generation
+        # 种子信息或其任意节点最后变更的代数
+        self.touched_gen = generation
+        # (ip, port) -> [peer, added_gen, changed_gen]
+        self.peers = {}
+        # (ip, port) -> (removed_gen, added_gen)
+        self.removed_peers = {}
+
+
+def _peer_key(peer):
+    return peer["ip"], peer["port"]
+
+
+class SnapshotCache:
+    """活跃种子快照缓存
+
+    按代数（generation）记录每个种子及其节点的新增、变更与移除，
+    用于向客户端返回自某个令牌以来的增量数据。
+    """
+
+    def __init__(self, retention=DEFAULT_RETENTION):
+        self.epoch = new_epoch()
+        self.generation = 0
+        self.retention = retention
+        self.torrents: dict[str, _TorrentEntry] = {}
+        # torrent_id -> (removed_gen, added_gen)
+        self.removed_torrents: dict[str, tuple] = {}
+
+    @property
+    def token(self) -> str:
+        return format_cursor(self.epoch, self.generation)
+
+    @property
+    def floor(self) -> int:
+        """仍可进行增量同步的最小代数"""
+        return max(self.generation - self.retention, 0)
+
+    def parse_token(self, token):
+        """解析令牌，令牌无效或已过期时返回 None"""
+        return parse_cursor(token, self.epoch, self.floor, self.generation)
+
+    def update(self, torrents):
+        """写入一次新的全量快照并推进代数
+
+        Args:
+            torrents (list[dict]): 活跃种子字典（含 peers）的列表
+        """
+        self.generation += 1
+        gen = self.generation
+
+        seen = set()
+        for torrent in torrents:
+            torrent_id = torrent["id"]
+            seen.add(torrent_id)
+            info = {key: value for key, value in torrent.items() if key != "peers"}
+
+            entry = self.torrents.get(torrent_id)
+            if entry is None:
+                entry = _TorrentEntry(info, gen)
+                self.torrents[torrent_id] = entry
+                self.removed_torrents.pop(torrent_id, None)
+            elif entry.info != info:
+                entry.info = info
+                entry.touched_gen = gen
+
+            self._update_peers(entry, torrent.get("peers", []), gen)
+
+        for torrent_id in list(self.torrents):
+            if torrent_id not in seen:
+                entry = self.torrents.pop(torrent_id)
+                self.removed_torrents[torrent_id] = (gen, entry.added_gen)
+
+        self._prune()
+
+    @staticmethod
+    def _update_peers(entry, peers, gen):
+        seen = set()
+        for peer in peers:
+            key = _peer_key(peer)
+            seen.add(key)
+            record = entry.peers.get(key)
+            if record is None:
+                entry.peers[key] = [peer, gen, gen]
+                entry.removed_peers.pop(key, None)
+                entry.touched_gen = gen
+            elif record[0] != peer:
+                record[0] = peer
+                record[2] = gen
+                entry.touched_gen = gen
+
+        if len(seen) != len(entry.peers):
+            for key in list(entry.peers):
+                if key not in seen:
+                    record = entry.peers.pop(key)
+                    entry.removed_peers[key] = (gen, record[1])
+                    entry.touched_gen = gen
+
+    def _prune(self):
+        """清理已超出保留代数的移除记录"""
+        floor = self.floor
+        for torrent_id in [k for k, v in self.removed_torrents.items() if v[0] <= floor]:
+            del self.removed_torrents[torrent_id]
+        for entry in self.torrents.values():
+            if entry.removed_peers:
+                for key in [k for k, v in entry.removed_peers.items() if v[0] <= floor]:
+                    del entry.removed_peers[key]
+
+    def full(self) -> dict:
+        """返回全量同步结果"""
+        added = []
+        for entry in self.torrents.values():
+            torrent = dict(entry.info)
+            torrent["peers"] = [record[0] for record in entry.peers.values()]
+            added.append(torrent)
+        return {
+            "token": self.token,
+            "full": True,
+            "added": added,
+            "changed": [],
+            "removed": [],
+        }
+
+    def delta(self, token) -> dict:
+        """返回自令牌以来的增量结果，令牌无效或已过期时返回全量结果
+
+        Args:
+            token (str): 上一次调用返回的令牌
+        """
+        since = self.parse_token(token)
+        if since is None:
+            return self.full()
+
+        added = []
+        changed = []
+        for entry in self.torrents.values():
+            if entry.added_gen > since:
+                torrent = dict(entry.info)
+                torrent["peers"] = [record[0] for record in entry.peers.values()]
+                added.append(torrent)
+                continue
+            if entry.touched_gen <= since:
+                continue
+
+            torrent = dict(entry.info)
+            added_peers = []
+            changed_peers = []
+            for peer, added_gen, changed_gen in entry.peers.values():
+                if added_gen > since:
+                    added_peers.append(peer)
+                elif changed_gen > since:
+                    changed_peers.append(peer)
+            removed_peers = [
+                {"ip": key[0], "port": key[1]}
+                for key, (removed_gen, added_gen) in entry.removed_peers.items()
+                # 客户端未曾见过的节点无需通知移除
+                if removed_gen > since >= added_gen
+            ]
+            torrent["added_peers"] = added_peers
+            torrent["changed_peers"] = changed_peers
+            torrent["removed_peers"] = removed_peers
+            changed.append(torrent)
+
+        removed = [
+            torrent_id
+            for torrent_id, (removed_gen, added_gen) in self.removed_torrents.items()
+            if removed_gen > since >= added_gen
+        ]
+
+        return {
+            "token": self.token,
+            "full": False,
+            "added": added,
+            "changed": changed,
+            "removed": removed,
+        }
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2024 azicen <chenjiazi2000@outlook.com>
+#
+# This file is part of PeerBanHelperAdapter and is licensed under MIT license, or later,
+# with the additional special exception to link portions of this program with
+# the OpenSSL library. See LICENSE for more details.
+from __future__ import unicode_literals
+
+import logging
+import mmap
+import os
+import struct
+
+log = logging.getLogger(__name__)
+
+# 快照文件头：魔数、版本、IPv4 条目数、IPv6 条目数
+_HEADER = struct.Struct(">4sH2xII")
+_MAGIC = b"PBHB"
+_VERSION = 1
+
+# 快照记录：起始地址、结束地址（大端，按起始地址排序）、过期时间戳（整数秒，0 表示永久）
+_RECORDS = {
+    4: struct.Struct(">IId"),
+    6: struct.Struct(">16s16sd"),
+}
+
+# 日志记录：操作、地址族、过期时间戳、起始地址、结束地址（均按 16 字节存放）
+_JOURNAL = struct.Struct(">BBd16s16s")
+_OP_ADD = 1
+_OP_REMOVE = 2
+# 只删除完全一致的条目，不拆分重叠的条目（全量替换的差异）
+_OP_DELETE = 3
+
+# 日志记录数超过 max(该值, 条目数) 时进行压缩
+DEFAULT_COMPACT_THRESHOLD = 4096
+
+
+def _unpack_address(family, value):
+    return value if family == 4 else int.from_bytes(value, "big")
+
+
+def _pack_address(family, value):
+    return value if family == 4 else value.to_bytes(16, "big")
+
+
+class BlocklistStore:
+    """封禁列表的二进制持久化
+
+    由排序后的定长快照文件与仅追加的变更日志组成。每次封禁与解封只向日志追加少量定长记录，
+    日志增长到一定规模后重写快照并清空日志。快照文件可以直接内存映射读取。
+    """
+
+    def __init__(self, path, compact_threshold=DEFAULT_COMPACT_THRESHOLD):
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.compact_threshold = compact_threshold
+        # 当前日志中的记录数
+        self.journal_records = 0
+        self._journal = None
+
+    @property
+    def exists(self) -> bool:
+        return os.path.exists(self.path) or os.path.exists(self.journal_path)
+
+    def load(self, blocklist):
+        """读取快照并重放日志，恢复到 blocklist 中"""
+        blocklist.load(self._read_snapshot())
+        self.journal_records = self._replay_journal(blocklist)
+
+    def append_add(self, ranges, expires_at=None):
+        """记录新增（或更新过期时间）的 (地址族, 起始地址, 结束地址)"""
+        self._append(_OP_ADD, ranges, expires_at)
+
+    def append_remove(self, ranges):
+        """记录解封的 (地址族, 起始地址, 结束地址)"""
+        self._append(_OP_REMOVE, ranges, None)
+
+    def append_delete(self, ranges):
+        """记录全量替换中被删除的 (地址族, 起始地址, 结束地址)"""
+        self._append(_OP_DELETE, ranges, None)
+
+    def needs_compaction(self, size) -> bool:
+        return self.journal_records > max(self.compact_threshold, size)
+
+    def compact(self, blocklist):
+        """将当前封禁列表写为新的快照并清空日志"""
+        records = {4: [], 6: []}
+        for family, start, end, expires_at in blocklist.records():
+            records[family].append(_RECORDS[family].pack(
+                _pack_address(family, start), _pack_address(family, end), expires_at or 0.0
+            ))
+
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, _VERSION, len(records[4]), len(records[6])))
+            f.write(b"".join(records[4]))
+            f.write(b"".join(records[6]))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+
+        # 快照已包含日志中的全部变更；若在此之前中断，重放日志的结果与快照一致
+        self.close()
+        with open(self.journal_path, "wb"):
+            pass
+        self.journal_records = 0
+
+    def close(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def _append(self, op, ranges, expires_at):
+        data = [
+            _JOURNAL.pack(op, family, expires_at or 0.0, start.to_bytes(16, "big"), end.to_bytes(16, "big"))
+            for family, start, end in ranges
+        ]
+        if not data:
+            return
+        if self._journal is None:
+            self._journal = open(self.journal_path, "ab")
+        self._journal.write(b"".join(data))
+        self._journal.flush()
+        self.journal_records += len(data)
+
+    def _read_snapshot(self):
+        if not os.path.exists(self.path) or os.path.getsize(self.path) < _HEADER.size:
+            return []
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            magic, version, count4, count6 = _HEADER.unpack_from(mapped)
+            if magic != _MAGIC or version != _VERSION:
+                log.error("PeerBanHelperAdapter: 无法识别的封禁列表文件 %s", self.path)
+                return []
+
+            records = []
+            offset = _HEADER.size
+            for family, count in ((4, count4), (6, count6)):
+                record = _RECORDS[family]
+                end_offset = offset + record.size * count
+                with memoryview(mapped)[offset:end_offset] as view:
+                    for start, end, expires_at in record.iter_unpack(view):
+                        records.append((
+                            family,
+                            _unpack_address(family, start),
+                            _unpack_address(family, end),
+                            int(expires_at) if expires_at else None,
+                        ))
+                offset = end_offset
+            return records
+
+    def _replay_journal(self, blocklist):
+        if not os.path.exists(self.journal_path):
+            return 0
+        with open(self.journal_path, "rb") as f:
+            data = f.read()
+        # 忽略写入中断留下的不完整记录
+        usable = len(data) - len(data) % _JOURNAL.size
+        if usable != len(data):
+            log.warning("PeerBanHelperAdapter: 封禁列表日志末尾存在不完整的记录，已忽略")
+            with open(self.journal_path, "r+b") as f:
+                f.truncate(usable)
+
+        # 连续的同类记录合并为一次批量操作
+        count = 0
+        batch_key = None
+        batch = []
+        for op, family, expires_at, start, end in _JOURNAL.iter_unpack(memoryview(data)[:usable]):
+            key = (op, expires_at)
+            if key != batch_key:
+                self._apply(blocklist, batch_key, batch)
+                batch_key = key
+                batch = []
+            batch.append((family, int.from_bytes(start, "big"), int.from_bytes(end, "big")))
+            count += 1
+        self._apply(blocklist, batch_key, batch)
+        return count
+
+    @staticmethod
+    def _apply(blocklist, batch_key, batch):
+        if not batch:
+            return
+        op, expires_at = batch_key
+        if op == _OP_ADD:
+            blocklist.add_ranges(batch, int(expires_at) if expires_at else None)
+        elif op == _OP_REMOVE:
+            blocklist.remove_ranges(batch)
+        elif op == _OP_DELETE:
+            blocklist.discard_ranges(batch)
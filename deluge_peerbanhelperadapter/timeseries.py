@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2024 azicen <chenjiazi2000@outlook.com>
+#
+# This file is part of PeerBanHelperAdapter and is licensed under MIT license, or later,
+# with the additional special exception to link portions of this program with
+# the OpenSSL library. See LICENSE for more details.
+from __future__ import unicode_literals
+
+import logging
+import os
+import struct
+
+log = logging.getLogger(__name__)
+
+# 文件头：魔数、版本、时间粒度（秒）、容量（记录数）、列数、列名长度，随后为以换行分隔的列名
+_HEADER = struct.Struct(">4sHxxIIHH")
+_MAGIC = b"PBHT"
+_VERSION = 1
+
+# 时间粒度名称 -> (粒度秒数, 保留的记录数)，超过保留期的记录被新记录覆盖
+RESOLUTIONS = {
+    "minute": (60, 7 * 24 * 60),
+    "hour": (3600, 90 * 24),
+    "day": (86400, 10 * 366),
+}
+
+
+class _SeriesFile:
+    """固定容量的环形时间序列文件
+
+    每条记录为定长的 (时间段起点, 各列的值)，按 时间段序号 % 容量 定位，
+    读写任意时间段只需一次定位读写，超过保留期的时间段被自然覆盖。
+    """
+
+    def __init__(self, path, step, capacity, names):
+        self.path = path
+        self.step = step
+        self.capacity = capacity
+        self.record = struct.Struct(">I%dq" % len(names))
+        names_blob = "\n".join(names).encode("utf-8")
+        header = _HEADER.pack(_MAGIC, _VERSION, step, capacity, len(names), len(names_blob)) + names_blob
+        self.offset = len(header)
+
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                existing = f.read(len(header))
+            if existing != header:
+                log.warning("PeerBanHelperAdapter: 统计文件 %s 的格式已变化，重新创建", path)
+                os.remove(path)
+        if not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.write(header)
+                # 稀疏文件，空记录的时间段起点为 0
+                f.truncate(self.offset + capacity * self.record.size)
+        self._fd = os.open(path, os.O_RDWR)
+
+    def _position(self, bucket):
+        return self.offset + (bucket // self.step) % self.capacity * self.record.size
+
+    def read(self, bucket):
+        """读取时间段的值，记录不存在或已被覆盖时返回 None"""
+        data = os.pread(self._fd, self.record.size, self._position(bucket))
+        if len(data) < self.record.size:
+            return None
+        fields = self.record.unpack(data)
+        if fields[0] != bucket:
+            return None
+        return list(fields[1:])
+
+    def write(self, bucket, values):
+        os.pwrite(self._fd, self.record.pack(bucket, *values), self._position(bucket))
+
+    def iter_range(self, start, end):
+        """产生 [start, end] 内存在的 (时间段起点, 值元组)，按时间顺序
+
+        最多读取两段连续的记录，内存占用只与查询范围相关。
+        """
+        first = start // self.step
+        last = end // self.step
+        # 超过容量的部分已被覆盖
+        first = max(first, last - self.capacity + 1)
+        if first > last:
+            return
+        size = self.record.size
+        spans = []
+        index = first
+        while index <= last:
+            slot = index % self.capacity
+            count = min(last - index + 1, self.capacity - slot)
+            spans.append((slot, count))
+            index += count
+        for slot, count in spans:
+            data = os.pread(self._fd, count * size, self.offset + slot * size)
+            for fields in self.record.iter_unpack(data[:len(data) - len(data) % size]):
+                bucket = fields[0]
+                if start // self.step * self.step <= bucket <= end:
+                    yield bucket, fields[1:]
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class TimeSeriesStore:
+    """会话统计的多粒度时间序列
+
+    每次会话统计采样时，将计数器的增量累加到当前分钟、小时、天的时间段中并写回对应的记录；
+    瞬时值（如连接数）保存时间段内的最后一次采样。
+    """
+
+    def __init__(self, path_prefix, names, gauge_names=()):
+        self.names = tuple(names)
+        gauge_names = set(gauge_names)
+        # 各列是否为瞬时值
+        self._gauges = tuple(name in gauge_names for name in self.names)
+        self.series = {
+            resolution: _SeriesFile("%s.%s" % (path_prefix, resolution), step, capacity, self.names)
+            for resolution, (step, capacity) in RESOLUTIONS.items()
+        }
+        # 粒度 -> [时间段起点, 值列表]
+        self._current = {}
+        self._previous = None
+
+    def add(self, timestamp, values):
+        """写入一次采样
+
+        Args:
+            timestamp (float): 采样时间戳
+            values (dict): 计数器名称 -> 自会话开始以来的值
+        """
+        row = [values.get(name, 0) for name in self.names]
+        previous = self._previous
+        self._previous = row
+        if previous is None:
+            # 首次采样只作为计算增量的基准
+            return
+        deltas = [
+            value if gauge else max(value - last, 0)
+            for value, last, gauge in zip(row, previous, self._gauges)
+        ]
+
+        timestamp = int(timestamp)
+        for resolution, series in self.series.items():
+            bucket = timestamp // series.step * series.step
+            current = self._current.get(resolution)
+            if current is None or current[0] != bucket:
+                # 插件重新启用时继续累加同一时间段中已写入的值
+                current = [bucket, series.read(bucket) or [0] * len(self.names)]
+                self._current[resolution] = current
+            totals = current[1]
+            for index, delta in enumerate(deltas):
+                if self._gauges[index]:
+                    totals[index] = delta
+                else:
+                    totals[index] += delta
+            series.write(bucket, totals)
+
+    def query(self, resolution, start, end, names=None):
+        """读取时间范围内的记录
+
+        Args:
+            resolution (str): RESOLUTIONS 中的粒度名称
+            start (int): 起始时间戳（包含）
+            end (int): 结束时间戳（包含）
+            names (list[str]): 需要的列，为空时返回全部列
+
+        Returns:
+            {"resolution", "step", "names", "points"}，points 的元素为 [时间段起点, 各列的值]，
+            计数器为时间段内的增量，瞬时值为时间段内最后一次采样
+        """
+        series = self.series.get(resolution)
+        if series is None:
+            raise ValueError("不支持的时间粒度: %s" % resolution)
+        names = [name for name in names if name in self.names] if names else list(self.names)
+        indices = [self.names.index(name) for name in names]
+        points = [
+            [bucket] + [values[index] for index in indices]
+            for bucket, values in series.iter_range(int(start), int(end))
+        ]
+        return {
+            "resolution": resolution,
+            "step": series.step,
+            "names": names,
+            "points": points,
+        }
+
+    def close(self):
+        for series in self.series.values():
+            series.close()
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2024 azicen <chenjiazi2000@outlook.com>
+#
+# This file is part of PeerBanHelperAdapter and is licensed under MIT license, or later,
+# with the additional special exception to link portions of this program with
+# the OpenSSL library. See LICENSE for more details.
+from __future__ import unicode_literals
+
+import logging
+import time
+
+from twisted.internet import threads
+from twisted.internet.task import LoopingCall
+
+from deluge_peerbanhelperadapter.collector import row_projector
+from deluge_peerbanhelperadapter.model.torrent import ACTIVE_TORRENT_FIELDS, PEER_FIELDS
+
+log = logging.getLogger(__name__)
+
+_PEER_IP_INDEX = PEER_FIELDS.index("ip")
+
+
+class ActiveSnapshot:
+    """一次完整的活跃种子采集结果，种子与节点均包含全部字段"""
+
+    __slots__ = ("sequence", "timestamp", "torrents")
+
+    def __init__(self, sequence, timestamp, torrents):
+        self.sequence = sequence
+        self.timestamp = timestamp
+        # [(种子字典, 节点元组列表)]
+        self.torrents = torrents
+
+    @property
+    def age(self) -> float:
+        return max(time.time() - self.timestamp, 0.0)
+
+    def project(self, torrent_fields=ACTIVE_TORRENT_FIELDS, peer_fields=PEER_FIELDS, peer_filter=None):
+        """按需要的字段投影快照，返回 [(种子字典, 节点元组列表)]"""
+        return list(self.iter_project(torrent_fields, peer_fields, peer_filter))
+
+    def iter_project(self, torrent_fields=ACTIVE_TORRENT_FIELDS, peer_fields=PEER_FIELDS, peer_filter=None):
+        """惰性投影快照，逐个产生 (种子字典, 节点元组列表)
+
+        Args:
+            peer_filter (PeerFilter): 节点过滤条件，在投影前作用于完整的节点元组
+        """
+        project_row = row_projector(PEER_FIELDS, peer_fields)
+        accept = peer_filter.row_predicate() if peer_filter is not None else None
+        for torrent, rows in self.torrents:
+            if torrent_fields != ACTIVE_TORRENT_FIELDS:
+                torrent = {name: torrent[name] for name in torrent_fields}
+            if accept is not None:
+                rows = [row for row in rows if accept(row)]
+            if project_row is not None:
+                rows = [project_row(row) for row in rows]
+            yield torrent, rows
+
+
+class SnapshotWorker:
+    """在 reactor 线程池中定期采集活跃种子快照
+
+    RPC 调用只读取最近一次的快照，响应耗时不再随种子和节点数量增长。
+    线程池中只读取 libtorrent，采集期间产生的其他状态更新由 apply 在 reactor 线程中完成。
+    """
+
+    def __init__(self, collect, apply=None):
+        # 采集函数，在线程池中执行，返回 ([(种子字典, 节点元组列表)], 待应用的更新)
+        self.collect = collect
+        # 以待应用的更新调用的函数，在 reactor 线程中执行
+        self.apply = apply
+        self.snapshot = None
+        self.interval = 0
+        self._sequence = 0
+        self._loop = None
+
+    @property
+    def running(self) -> bool:
+        return self._loop is not None and self._loop.running
+
+    def start(self, interval):
+        """以指定间隔（秒）开始采集，间隔不大于 0 时停止"""
+        if self.running and interval == self.interval:
+            return
+        self.stop()
+        self.interval = interval
+        if interval <= 0:
+            return
+        self._loop = LoopingCall(self._refresh)
+        self._loop.start(interval, now=True)
+
+    def stop(self):
+        if self.running:
+            self._loop.stop()
+        self._loop = None
+        self.snapshot = None
+
+    def latest(self):
+        """返回最近一次快照，未运行时返回 None
+
+        首次采集尚未完成时同步采集一次。
+        """
+        if not self.running:
+            return None
+        if self.snapshot is None:
+            self._store(self.collect())
+        return self.snapshot
+
+    def discard_peers(self, ips, torrent_ids):
+        """从最近一次快照中移除已断开的节点，生成新的快照序号
+
+        Args:
+            ips (set[str]): 需要移除的节点 IP
+            torrent_ids (set[str]): 这些节点所在的种子 ID，其余种子的节点列表保持不变
+        """
+        snapshot = self.snapshot
+        if snapshot is None or not ips:
+            return
+        torrents = []
+        for torrent, rows in snapshot.torrents:
+            if torrent["id"] in torrent_ids:
+                rows = [row for row in rows if row[_PEER_IP_INDEX] not in ips]
+            torrents.append((torrent, rows))
+        self._sequence += 1
+        self.snapshot = ActiveSnapshot(self._sequence, snapshot.timestamp, torrents)
+
+    def _refresh(self):
+        # 返回 Deferred，LoopingCall 会等待本次采集完成后再调度下一次
+        d = threads.deferToThread(self.collect)
+        d.addCallback(self._store)
+        d.addErrback(self._on_error)
+        return d
+
+    def _store(self, result):
+        if not self.running:
+            # 采集期间已被停止
+            return
+        torrents, updates = result
+        if self.apply is not None:
+            self.apply(updates)
+        self._sequence += 1
+        self.snapshot = ActiveSnapshot(self._sequence, time.time(), torrents)
+
+    @staticmethod
+    def _on_error(failure):
+        log.error("PeerBanHelperAdapter: 快照采集失败: %s", failure.getErrorMessage())
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2024 azicen <chenjiazi2000@outlook.com>
+#
+# This file is part of PeerBanHelperAdapter and is licensed under MIT license, or later,
+# with the additional special exception to link portions of this program with
+# the OpenSSL library. See LICENSE for more details.
+import random
+
+import pytest
+
+from deluge_peerbanhelperadapter import blocklist as blocklist_module
+from deluge_peerbanhelperadapter.blocklist import Blocklist, IntervalSet, entry_hash
+
+
+def _ban(blocklist, entries, expires_at=None):
+    return blocklist.add_ranges(blocklist.parse_entries(entries), expires_at)
+
+
+def _unban(blocklist, entries):
+    return blocklist.remove_ranges(blocklist.parse_entries(entries))
+
+
+def _assert_intervals_consistent(blocklist):
+    for family, intervals in blocklist._intervals.items():
+        expected = IntervalSet.from_ranges(
+            (start, end) for entry_family, start, end in blocklist._entries.values() if entry_family == family
+        )
+        assert list(intervals) == list(expected)
+
+
+def _random_entry(rng):
+    value = rng.randrange(0, 240)
+    kind = rng.random()
+    if kind < 0.7:
+        return "10.0.0.%d" % value
+    if kind < 0.85:
+        return "10.0.0.%d/29" % (value & ~7)
+    return "10.0.0.%d-10.0.0.%d" % (value, value + rng.randrange(1, 15))
+
+
+def test_partial_unban_of_cidr_keeps_the_rest():
+    blocklist = Blocklist()
+    _ban(blocklist, ["10.0.0.0/24"], expires_at=100.0)
+
+    assert _unban(blocklist, ["10.0.0.128/25"]) == ["10.0.0.128/25"]
+    assert set(blocklist) == {"10.0.0.0/25"}
+
+    _unban(blocklist, ["10.0.0.5"])
+    assert set(blocklist) == {"10.0.0.0-10.0.0.4", "10.0.0.6-10.0.0.127"}
+    assert blocklist.covers("10.0.0.4")
+    assert not blocklist.covers("10.0.0.5")
+    assert not blocklist.covers("10.0.0.200")
+    # 拆分后的部分沿用原条目的过期时间
+    assert blocklist.expires == {"10.0.0.0-10.0.0.4": 100.0, "10.0.0.6-10.0.0.127": 100.0}
+    _assert_intervals_consistent(blocklist)
+
+
+def test_unban_of_unrelated_range_has_no_effect():
+    blocklist = Blocklist()
+    _ban(blocklist, ["10.0.0.0/24"])
+    version = blocklist.version
+
+    assert _unban(blocklist, ["10.0.1.1"]) == []
+    assert blocklist.version == version
+
+
+def test_incremental_intervals_match_rebuild(monkeypatch):
+    # 阈值足够大时只走逐条插入与删除的路径
+    monkeypatch.setattr(blocklist_module, "_REBUILD_THRESHOLD", 1 << 20)
+    rebuilds = []
+    original_rebuild = Blocklist._rebuild
+
+    def counting_rebuild(self):
+        rebuilds.append(1)
+        original_rebuild(self)
+
+    monkeypatch.setattr(Blocklist, "_rebuild", counting_rebuild)
+
+    rng = random.Random(8)
+    blocklist = Blocklist()
+    for _ in range(500):
+        operation = rng.random()
+        if operation < 0.4:
+            _ban(blocklist, [_random_entry(rng) for _ in range(rng.randrange(1, 20))])
+        elif operation < 0.6:
+            _unban(blocklist, [_random_entry(rng) for _ in range(rng.randrange(1, 4))])
+        elif operation < 0.8:
+            singles = [key for key in blocklist if "/" not in key and "-" not in key]
+            blocklist.discard_ranges(blocklist.parse_entries(rng.sample(singles, min(len(singles), 3))))
+        else:
+            current = list(blocklist)
+            rng.shuffle(current)
+            # 只移除单个 IP，保持在逐条更新的路径上
+            kept = [key for key in current if "/" in key or "-" in key or rng.random() < 0.8]
+            blocklist.replace(kept + [_random_entry(rng) for _ in range(rng.randrange(0, 5))])
+        _assert_intervals_consistent(blocklist)
+
+    assert rebuilds == []
+
+
+def test_replace_applies_only_the_difference():
+    blocklist = Blocklist()
+    blocklist.replace(["1.1.1.1", "2.2.2.0/24", "3.3.3.3"])
+    _ban(blocklist, ["3.3.3.3"], expires_at=50.0)
+    version = blocklist.version
+
+    assert blocklist.replace(["3.3.3.3", "2.2.2.0/24", "1.1.1.1"]) == ([], [])
+    assert blocklist.version == version
+
+    added, removed = blocklist.replace(["2.2.2.0/24", "3.3.3.3", "4.4.4.4"])
+    assert (added, removed) == (["4.4.4.4"], ["1.1.1.1"])
+    # 保留的条目沿用原有的过期时间
+    assert blocklist.expires == {"3.3.3.3": 50.0}
+    _assert_intervals_consistent(blocklist)
+
+
+def test_digest_and_changes_follow_every_update():
+    rng = random.Random(11)
+    blocklist = Blocklist(log_size=200)
+    client = set()
+    cursor = None
+    for step in range(300):
+        operation = rng.random()
+        if operation < 0.5:
+            _ban(blocklist, [_random_entry(rng) for _ in range(rng.randrange(1, 30))], rng.choice([None, 5.0]))
+        elif operation < 0.7:
+            _unban(blocklist, [_random_entry(rng) for _ in range(rng.randrange(1, 4))])
+        elif operation < 0.9:
+            current = list(blocklist)
+            blocklist.replace(current[: int(len(current) * 0.9)] + [_random_entry(rng)])
+        else:
+            blocklist.expire(rng.choice([4.0, 6.0]))
+
+        digest = 0
+        for key in blocklist:
+            digest ^= entry_hash(key)
+        assert blocklist.digest == "%016x" % digest
+
+        version = blocklist.parse_cursor(cursor)
+        changes = blocklist.changes(version) if version is not None else None
+        if changes is None:
+            client = set(blocklist)
+        else:
+            added, removed = changes
+            client = (client - set(removed)) | set(added)
+        assert client == set(blocklist), step
+        cursor = blocklist.cursor
+
+
+def test_cursor_from_another_epoch_is_rejected():
+    blocklist = Blocklist()
+    _ban(blocklist, ["1.1.1.1"])
+    assert blocklist.parse_cursor(Blocklist().cursor) is None
+    assert blocklist.parse_cursor("invalid") is None
+    assert blocklist.parse_cursor(blocklist.cursor) == blocklist.version
+
+
+def test_split_pieces_keep_the_longest_expiry():
+    blocklist = Blocklist()
+    _ban(blocklist, ["10.0.0.0/25"])
+    _ban(blocklist, ["10.0.0.0/24"], expires_at=100)
+    _ban(blocklist, ["10.0.1.0/25"], expires_at=50)
+    _ban(blocklist, ["10.0.1.0/24"], expires_at=100)
+
+    _unban(blocklist, ["10.0.0.5", "10.0.1.5"])
+    assert blocklist.expires["10.0.1.0-10.0.1.4"] == 100
+    assert "10.0.0.0-10.0.0.4" not in blocklist.expires
+
+    # 永久封禁的部分不会随重叠的条目过期
+    blocklist.expire(101)
+    assert set(blocklist) == {"10.0.0.0-10.0.0.4", "10.0.0.6-10.0.0.127"}
+    assert blocklist.covers("10.0.0.4")
+    assert not blocklist.covers("10.0.1.4")
+    _assert_intervals_consistent(blocklist)
+
+
+def test_split_piece_does_not_shorten_an_existing_entry():
+    blocklist = Blocklist()
+    _ban(blocklist, ["10.0.0.0-10.0.0.4"])
+    _ban(blocklist, ["10.0.0.0/24"], expires_at=100)
+
+    _unban(blocklist, ["10.0.0.5"])
+    assert "10.0.0.0-10.0.0.4" not in blocklist.expires
+    blocklist.expire(101)
+    assert set(blocklist) == {"10.0.0.0-10.0.0.4"}
+
+
+def test_expiry_updates_intervals_incrementally(monkeypatch):
+    blocklist = Blocklist()
+    blocklist.replace(["10.0.%d.%d" % (i >> 8, i & 0xFF) for i in range(2000)] + ["10.0.0.0/28"])
+    _ban(blocklist, ["10.0.0.5", "10.0.9.1"], expires_at=100)
+    _ban(blocklist, ["10.0.9.2"], expires_at=200)
+    monkeypatch.setattr(Blocklist, "_rebuild", lambda self: pytest.fail("expire should not rebuild"))
+
+    assert sorted(blocklist.expire(150)) == ["10.0.0.5", "10.0.9.1"]
+    # 10.0.0.5 仍被 10.0.0.0/28 覆盖
+    assert blocklist.covers("10.0.0.5")
+    assert not blocklist.covers("10.0.9.1")
+    assert blocklist.covers("10.0.9.2")
+    _assert_intervals_consistent(blocklist)
+
+
+def test_interval_difference():
+    intervals = IntervalSet.from_ranges([(0, 10), (20, 30), (40, 50)])
+    other = IntervalSet.from_ranges([(5, 6), (9, 22), (30, 45), (60, 70)])
+    assert list(intervals.difference(other)) == [(0, 4), (7, 8), (23, 29), (46, 50)]
+    assert list(intervals.difference(IntervalSet())) == list(intervals)
+    assert list(IntervalSet().difference(intervals)) == []
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2024 azicen <chenjiazi2000@outlook.com>
+#
+# This file is part of PeerBanHelperAdapter and is licensed under MIT license, or later,
+# with the additional special exception to link portions of this program with
+# the OpenSSL library. See LICENSE for more details.
+import os
+
+import pytest
+
+from deluge_peerbanhelperadapter.blocklist import Blocklist
+from deluge_peerbanhelperadapter.store import BlocklistStore
+
+
+def _reload(path):
+    blocklist = Blocklist()
+    store = BlocklistStore(path)
+    store.load(blocklist)
+    return blocklist, store
+
+
+def _state(blocklist):
+    return list(blocklist.records())
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "blocklist")
+
+
+def test_journal_replay_restores_adds_removes_and_ttl_updates(path):
+    blocklist = Blocklist()
+    store = BlocklistStore(path)
+
+    for entries, expires_at in (
+        (["1.1.1.1", "10.0.0.0/24", "2001:db8::/64"], None),
+        (["2.2.2.2", "3.3.3.3"], 100.0),
+        # 已封禁的条目以新的过期时间为准
+        (["2.2.2.2"], 200.0),
+        (["3.3.3.3"], None),
+    ):
+        ranges = blocklist.parse_entries(entries)
+        blocklist.add_ranges(ranges, expires_at)
+        store.append_add(ranges, expires_at)
+
+    ranges = blocklist.parse_entries(["10.0.0.128/25"])
+    blocklist.remove_ranges(ranges)
+    store.append_remove(ranges)
+
+    ranges = blocklist.parse_entries(["1.1.1.1"])
+    blocklist.discard_ranges(ranges)
+    store.append_delete(ranges)
+    store.close()
+
+    restored, restored_store = _reload(path)
+    assert _state(restored) == _state(blocklist)
+    assert restored.expires == {"2.2.2.2": 200}
+    # 过期时间以整数秒恢复，RPC 返回时不会被编码为浮点数
+    assert all(isinstance(expires_at, int) for expires_at in restored.expires.values())
+    assert restored_store.journal_records == 9
+
+
+def test_delete_does_not_split_overlapping_entries(path):
+    blocklist = Blocklist()
+    store = BlocklistStore(path)
+    ranges = blocklist.parse_entries(["10.0.0.0/24", "10.0.0.5"])
+    blocklist.add_ranges(ranges)
+    store.append_add(ranges)
+
+    blocklist.replace(["10.0.0.0/24"])
+    store.append_delete(blocklist.parse_entries(["10.0.0.5"]))
+    store.close()
+
+    restored, _ = _reload(path)
+    assert set(restored) == {"10.0.0.0/24"}
+    assert restored.covers("10.0.0.5")
+
+
+def test_compaction_then_journal(path):
+    blocklist = Blocklist()
+    store = BlocklistStore(path)
+    blocklist.replace(["1.1.1.1", "10.0.0.0/24"])
+    ranges = blocklist.parse_entries(["1.1.1.1"])
+    blocklist.add_ranges(ranges, 300.0)
+    store.compact(blocklist)
+    assert store.journal_records == 0
+
+    ranges = blocklist.parse_entries(["4.4.4.4"])
+    blocklist.add_ranges(ranges)
+    store.append_add(ranges)
+    store.close()
+
+    restored, _ = _reload(path)
+    assert _state(restored) == _state(blocklist)
+
+
+def test_torn_last_journal_record_is_ignored(path):
+    blocklist = Blocklist()
+    store = BlocklistStore(path)
+    for entry in ("1.1.1.1", "2.2.2.2", "3.3.3.3"):
+        ranges = blocklist.parse_entries([entry])
+        blocklist.add_ranges(ranges)
+        store.append_add(ranges)
+    store.close()
+
+    journal_path = store.journal_path
+    record_size = os.path.getsize(journal_path) // 3
+    # 最后一条记录写入中断
+    with open(journal_path, "r+b") as f:
+        f.truncate(record_size * 3 - 5)
+
+    restored, restored_store = _reload(journal_path[: -len(".journal")])
+    assert set(restored) == {"1.1.1.1", "2.2.2.2"}
+    assert restored_store.journal_records == 2
+    assert os.path.getsize(journal_path) == record_size * 2
+
+    # 截断后可以继续追加
+    ranges = restored.parse_entries(["4.4.4.4"])
+    restored.add_ranges(ranges)
+    restored_store.append_add(ranges)
+    restored_store.close()
+    again, _ = _reload(path)
+    assert set(again) == {"1.1.1.1", "2.2.2.2", "4.4.4.4"}
+
+
+def test_replay_matches_runtime_after_expiry(path):
+    blocklist = Blocklist()
+    store = BlocklistStore(path)
+    for entries, expires_at in ((["10.0.0.0/25"], None), (["10.0.0.0/24"], 100)):
+        ranges = blocklist.parse_entries(entries)
+        blocklist.add_ranges(ranges, expires_at)
+        store.append_add(ranges, expires_at)
+
+    # 与 Core 一致，过期以删除记录写入日志
+    store.append_delete(blocklist.parse_entries(blocklist.expire(101)))
+    ranges = blocklist.parse_entries(["10.0.0.5"])
+    blocklist.remove_ranges(ranges)
+    store.append_remove(ranges)
+    store.close()
+
+    restored, _ = _reload(path)
+    restored.expire(200)
+    assert set(restored) == set(blocklist) == {"10.0.0.0-10.0.0.4", "10.0.0.6-10.0.0.127"}
+    assert _state(restored) == _state(blocklist)